@@ -7,6 +7,12 @@ from mistral.actions import base
 
 LOG = logging.getLogger(__name__)
 
+# Prefer the libyaml C loader, fall back to the pure Python one
+try:
+    YamlLoader = yaml.CSafeLoader
+except AttributeError:
+    YamlLoader = yaml.SafeLoader
+
 DEFAULT_METADATA = {
     'name': 'Unnamed',
     'description': 'No description',
@@ -31,9 +37,10 @@ def load_validations(groups=None):
     '''Loads all validations.'''
     paths = glob.glob('{}/*.yaml'.format(VALIDATIONS_DIR))
     results = []
+    LOG.debug("Loading validations using %s.", YamlLoader.__name__)
     for index, validation_path in enumerate(sorted(paths)):
         with open(validation_path) as f:
-            validation = yaml.safe_load(f.read())
+            validation = yaml.load(f.read(), Loader=YamlLoader)
             validation_groups = get_validation_metadata(validation, 'groups')
             if not groups or \
                     set.intersection(set(groups), set(validation_groups)):
@@ -1,36 +1,254 @@
-#!/tmp/validations-venv/bin/python
+#!/usr/bin/env python
 
-# Disable scapy's warning to stderr:
-import logging
+# Look for DHCP servers answering on the given interfaces (all interfaces
+# that are up by default).
+#
+# A DHCPDISCOVER is broadcast on every interface at once and offers are
+# received on raw sockets of all interfaces by one select loop. The probe
+# ends once no new server answered for a quiet period (which grows with the
+# slowest answer seen), or after the timeout at the latest.
+#
+# It can be tried against a local veth pair with a stand-in DHCP server
+# (e.g. dnsmasq) on one end:
+#
+#   ip link add probe0 type veth peer name server0
+#   ip addr add 192.0.2.1/24 dev server0
+#   ip link set probe0 up; ip link set server0 up
+#   dnsmasq --no-daemon --interface=server0 --dhcp-range=192.0.2.10,192.0.2.20
+#   rogue_dhcp.py --interface probe0
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import select
+import socket
+import struct
 import sys
-logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
+import time
+
+SYSFS_NET = '/sys/class/net'
+ARPHRD_ETHER = 1
+ETH_P_IP = 0x0800
+BOOTP_REQUEST = 1
+BOOTP_REPLY = 2
+DHCP_MAGIC = b'\x63\x82\x53\x63'
+DHCP_MESSAGE_TYPE = 53
+DHCP_SERVER_ID = 54
+DHCP_END = 255
+DHCP_DISCOVER = 1
+DHCP_OFFER = 2
+
+
+def read_attribute(interface, name, sysfs):
+    with open(os.path.join(sysfs, interface, name)) as f:
+        return f.read().strip()
+
+
+def parse_mac(address):
+    """Return MAC address as bytearray, None unless it has 6 bytes."""
+
+    try:
+        mac = bytearray(int(x, 16) for x in address.split(':'))
+    except ValueError:
+        return None
+    return mac if len(mac) == 6 else None
+
+
+def ethernet_mac(interface, sysfs=SYSFS_NET):
+    """Return MAC address of Ethernet interface, None for other links."""
+
+    if read_attribute(interface, 'type', sysfs) != str(ARPHRD_ETHER):
+        return None
+    return parse_mac(read_attribute(interface, 'address', sysfs))
+
+
+def up_interfaces(sysfs=SYSFS_NET):
+    interfaces = []
+    for interface in sorted(os.listdir(sysfs)):
+        try:
+            state = read_attribute(interface, 'operstate', sysfs)
+            mac = ethernet_mac(interface, sysfs)
+        except IOError:
+            continue
+        # DHCPDISCOVER is an Ethernet frame, other links (lo, tun, ...)
+        # can't be probed
+        if mac is None:
+            continue
+        # Interfaces without carrier detection report unknown
+        if state in ('up', 'unknown'):
+            interfaces.append(interface)
+    return interfaces
+
+
+def checksum(data):
+    if len(data) % 2:
+        data = data + b'\x00'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total = total + (total >> 16)
+    return ~total & 0xffff
+
+
+def dhcp_discover(mac, xid):
+    bootp = struct.pack('!BBBBIHH4s4s4s4s16s64s128s',
+                        BOOTP_REQUEST, 1, 6, 0, xid, 0,
+                        0x8000,  # ask for broadcast replies, we have no IP
+                        b'', b'', b'', b'', bytes(mac), b'', b'')
+    options = (DHCP_MAGIC +
+               struct.pack('!BBB', DHCP_MESSAGE_TYPE, 1, DHCP_DISCOVER) +
+               struct.pack('!B', DHCP_END))
+    payload = bootp + options
+
+    udp = struct.pack('!HHHH', 68, 67, 8 + len(payload), 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64,
+                     socket.IPPROTO_UDP, 0, b'\x00' * 4, b'\xff' * 4)
+    ip = ip[:10] + struct.pack('!H', checksum(ip)) + ip[12:]
+
+    return (b'\xff' * 6 + bytes(mac) + struct.pack('!H', ETH_P_IP) +
+            ip + udp)
 
 
-from scapy.all import *
+def parse_offer(frame, xid):
+    """Return (server ip, server mac) of DHCPOFFER with xid, None otherwise."""
 
+    frame = bytearray(frame)
+    if len(frame) < 14 + 20 or struct.unpack('!H', bytes(frame[12:14]))[0] != ETH_P_IP:
+        return None
 
-def find_dhcp_servers(timeout_sec):
-    conf.checkIPaddr = False
-    fam, hw = get_if_raw_hwaddr(conf.iface)
-    dhcp_discover = (Ether(dst="ff:ff:ff:ff:ff:ff") /
-                     IP(src="0.0.0.0", dst="255.255.255.255") /
-                     UDP(sport=68, dport=67) /
-                     BOOTP(chaddr=hw) /
-                     DHCP(options=[("message-type", "discover"), "end"]))
-    ans, unans = srp(dhcp_discover, multi=True, timeout=timeout_sec, verbose=False)
+    ip = frame[14:]
+    ihl = (ip[0] & 0x0f) * 4
+    if ip[9] != socket.IPPROTO_UDP or len(ip) < ihl + 8:
+        return None
 
-    return [(unicode(packet[1][IP].src), packet[1][Ether].src)
-            for packet in ans]
+    udp = ip[ihl:]
+    if struct.unpack('!H', bytes(udp[2:4]))[0] != 68:
+        return None
+
+    bootp = udp[8:]
+    if (len(bootp) < 240 or bootp[0] != BOOTP_REPLY or
+            struct.unpack('!I', bytes(bootp[4:8]))[0] != xid or
+            bytes(bootp[236:240]) != DHCP_MAGIC):
+        return None
+
+    message_type = None
+    server = bytes(ip[12:16])
+    i = 240
+    while i < len(bootp) and bootp[i] != DHCP_END:
+        # Pad option has no length
+        if bootp[i] == 0:
+            i = i + 1
+            continue
+        if i + 1 >= len(bootp):
+            break
+        code, length = bootp[i], bootp[i + 1]
+        value = bootp[i + 2:i + 2 + length]
+        if code == DHCP_MESSAGE_TYPE and length == 1:
+            message_type = value[0]
+        elif code == DHCP_SERVER_ID and length == 4:
+            server = bytes(value)
+        i = i + 2 + length
+
+    if message_type != DHCP_OFFER:
+        return None
+
+    return (socket.inet_ntoa(server),
+            ':'.join('%02x' % b for b in frame[6:12]))
+
+
+def open_socket(interface):
+    """Return raw socket sending and receiving IP frames on interface."""
+
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                         socket.htons(ETH_P_IP))
+    try:
+        sock.bind((interface, 0))
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+def find_dhcp_servers(interfaces, timeout_sec, quiet_sec,
+                      open_socket=open_socket, sysfs=SYSFS_NET):
+    """Probe interfaces, return list of (server ip, server mac, interface).
+
+    The probe returns when no new server answered for quiet_sec (or twice
+    the slowest answer seen, whichever is longer), at most after timeout_sec.
+    """
+
+    probes = {}
+    try:
+        for interface in interfaces:
+            sock = open_socket(interface)
+            probes[sock] = (interface, random.randint(1, 0xffffffff))
+
+        start = time.time()
+        for sock, (interface, xid) in probes.items():
+            sock.send(dhcp_discover(ethernet_mac(interface, sysfs), xid))
+
+        servers = []
+        quiet = quiet_sec
+        last_change = start
+
+        while True:
+            now = time.time()
+            wait = min(start + timeout_sec, last_change + quiet) - now
+            if wait <= 0:
+                break
+
+            readable, _, _ = select.select(list(probes), [], [], wait)
+            for sock in readable:
+                interface, xid = probes[sock]
+                offer = parse_offer(sock.recv(65535), xid)
+                if offer is None:
+                    continue
+
+                server = offer + (interface,)
+                if server not in servers:
+                    servers.append(server)
+                    last_change = time.time()
+                    # Slow servers may have slow peers, wait longer for them
+                    quiet = max(quiet, 2 * (last_change - start))
+    finally:
+        for sock in probes:
+            sock.close()
+
+    return servers
 
 
 def main():
-    dhcp_servers = find_dhcp_servers(30)
+    parser = argparse.ArgumentParser(description='Look for DHCP servers.')
+    parser.add_argument('-i', '--interface', action='append',
+                        dest='interfaces',
+                        help='Interface to probe, may be repeated '
+                             '(default: all interfaces that are up).')
+    parser.add_argument('-t', '--timeout', type=float, default=30,
+                        help='Maximum time to wait for answers in seconds.')
+    parser.add_argument('-q', '--quiet', type=float, default=2,
+                        help='Stop after no new server answered for this '
+                             'many seconds.')
+    args = parser.parse_args()
+
+    for interface in args.interfaces or []:
+        try:
+            mac = ethernet_mac(interface)
+        except IOError:
+            mac = None
+        if mac is None:
+            parser.error('%s is not an Ethernet interface' % interface)
+
+    interfaces = args.interfaces or up_interfaces()
+    dhcp_servers = find_dhcp_servers(interfaces, args.timeout, args.quiet)
     if dhcp_servers:
-        sys.stderr.write('Found %d DHCP servers:' % len(dhcp_servers))
-        sys.stderr.write("\n".join(("* %s (%s)" % (ip, mac) for (ip, mac) in dhcp_servers)))
+        sys.stderr.write('Found %d DHCP servers:\n' % len(dhcp_servers))
+        sys.stderr.write("\n".join(("* %s (%s) on %s" % server
+                                    for server in dhcp_servers)))
+        sys.stderr.write('\n')
         sys.exit(1)
     else:
-        print "No DHCP servers found."
+        print("No DHCP servers found.")
 
 
 if __name__ == '__main__':
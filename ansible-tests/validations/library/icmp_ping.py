@@ -1,20 +1,52 @@
 #!/usr/bin/env python
 
+import math
+import os
+import re
+import select
+import socket
+import struct
+import subprocess
+import time
+
 from ansible.module_utils.basic import *
 
 DOCUMENTATION = '''
 ---
 module: icmp_ping
 short_description: ICMP ping remote hosts
-requirements: [ ping ]
 description:
     - Check host connectivity with ICMP ping.
+    - Echo requests are sent to all hosts at once, each host has its own
+      deadline for the reply.
+    - Unprivileged ICMP sockets are used when the kernel allows them
+      (net.ipv4.ping_group_range), raw sockets (root) otherwise.
+    - When neither socket can be opened (unprivileged user and the default
+      net.ipv4.ping_group_range), the ping command is run for all hosts
+      concurrently instead.
 options:
     host:
-        required: true
+        required: false
         description:
             - IP address or hostname of host to ping
         type: str
+    hosts:
+        required: false
+        description:
+            - List of IP addresses or hostnames to ping concurrently
+        type: list
+    count:
+        required: false
+        default: 1
+        description:
+            - Number of echo requests sent to each host
+        type: int
+    timeout:
+        required: false
+        default: 1
+        description:
+            - Seconds to wait for each reply
+        type: float
 author: "Martin Andre (@mandre)"
 '''
 
@@ -25,22 +57,233 @@ EXAMPLES = '''
   tasks:
     - name: Check Internet connectivity
       ping: host="www.ansible.com"
+
+# Ping more hosts at once:
+- hosts: undercloud
+  tasks:
+    - name: Check connectivity of the nodes
+      icmp_ping:
+        hosts: "{{ groups['overcloud'] }}"
+        count: 3
 '''
 
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+def checksum(data):
+    '''Internet checksum of the packet.'''
+    if len(data) % 2:
+        data = data + b'\x00'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total = total + (total >> 16)
+    return ~total & 0xffff
+
+
+def echo_request(ident, seq):
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    payload = b'icmp_ping' + b'\x00' * 23
+    return (header[:2] + struct.pack('!H', checksum(header + payload)) +
+            header[4:] + payload)
+
+
+def open_socket():
+    '''Return (socket, raw), prefer unprivileged ICMP datagram socket.'''
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                             socket.IPPROTO_ICMP), False
+    except socket.error:
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW,
+                             socket.IPPROTO_ICMP), True
+
+
+def parse_reply(packet, raw, ident):
+    '''Return sequence number of echo reply, None for other packets.
+
+    Datagram sockets receive replies to their own requests only (the kernel
+    replaces the identifier), raw sockets receive all ICMP of the host.
+    '''
+    packet = bytearray(packet)
+    if raw:
+        packet = packet[(packet[0] & 0x0f) * 4:]
+    if len(packet) < 8:
+        return None
+
+    icmp_type, code, _, reply_ident, seq = struct.unpack(
+        '!BBHHH', bytes(packet[:8]))
+    if icmp_type != ICMP_ECHO_REPLY or (raw and reply_ident != ident):
+        return None
+    return seq
+
+
+def resolve(hosts):
+    '''Return ({host: result}, {host: address}) with empty results.'''
+    results = {}
+    addresses = {}
+    for host in hosts:
+        results[host] = {'sent': 0, 'received': 0, 'loss': 100.0,
+                         'rtt_min': None, 'rtt_avg': None, 'rtt_max': None}
+        try:
+            addresses[host] = socket.gethostbyname(host)
+            results[host]['address'] = addresses[host]
+        except socket.error as e:
+            results[host]['error'] = str(e)
+    return results, addresses
+
+
+def sweep(hosts, count=1, timeout=1.0, icmp_socket=None):
+    '''Ping all hosts concurrently, return {host: result}.
+
+    Each round sends one echo request to every host and waits until all of
+    them replied or the timeout passed. Result of a host contains address,
+    sent, received, loss (percent) and rtt_min, rtt_avg, rtt_max in
+    milliseconds (None without reply), or error when it can't be resolved
+    or a request can't be sent to it (it is not pinged any more then).
+    icmp_socket is (socket, raw) as returned by open_socket, it is opened
+    when not given and closed at the end.
+    '''
+    results, addresses = resolve(hosts)
+    targets = [host for host in hosts if host in addresses]
+    rtts = dict((host, []) for host in targets)
+    sock, raw = icmp_socket or open_socket()
+    ident = os.getpid() & 0xffff
+    seq = 0
+
+    try:
+        for attempt in range(count):
+            # {sequence number: (host, time sent)}
+            pending = {}
+            for host in targets:
+                if 'error' in results[host]:
+                    continue
+                seq = (seq + 1) & 0xffff
+                try:
+                    sock.sendto(echo_request(ident, seq), (addresses[host], 0))
+                except socket.error as e:
+                    # e.g. no route to the host, other hosts are pinged
+                    results[host]['error'] = str(e)
+                    continue
+                pending[seq] = (host, time.time())
+                results[host]['sent'] += 1
+
+            deadline = time.time() + timeout
+            while pending:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    break
+                if not select.select([sock], [], [], wait)[0]:
+                    break
+
+                packet, (source, _) = sock.recvfrom(65535)
+                received = time.time()
+                reply = parse_reply(packet, raw, ident)
+                if reply not in pending:
+                    continue
+                host, sent = pending[reply]
+                if source != addresses[host]:
+                    continue
+
+                del pending[reply]
+                rtts[host].append((received - sent) * 1000)
+    finally:
+        sock.close()
+
+    for host in targets:
+        result = results[host]
+        result['received'] = len(rtts[host])
+        if result['sent']:
+            result['loss'] = 100.0 * (result['sent'] - result['received']) / \
+                result['sent']
+        if rtts[host]:
+            result['rtt_min'] = min(rtts[host])
+            result['rtt_avg'] = sum(rtts[host]) / len(rtts[host])
+            result['rtt_max'] = max(rtts[host])
+
+    return results
+
+
+def ping_processes(hosts, count=1, timeout=1.0):
+    '''Ping all hosts with concurrent ping processes, return {host: result}.
+
+    Used when no ICMP socket can be opened, ping has the privileges for it.
+    Results are the same as of sweep, parsed from the ping summary; output
+    of ping is the error when it did not get to sending requests.
+    '''
+    results, addresses = resolve(hosts)
+    processes = {}
+    for host in hosts:
+        if host not in addresses:
+            continue
+        command = ['ping', '-n', '-q', '-c', str(count),
+                   '-W', str(int(math.ceil(timeout))), addresses[host]]
+        try:
+            processes[host] = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                universal_newlines=True)
+        except OSError as e:
+            results[host]['error'] = 'Could not run ping: {}'.format(e)
+
+    for host, process in processes.items():
+        output = process.communicate()[0]
+        result = results[host]
+        packets = re.search(r'(\d+) packets transmitted, (\d+) (?:packets )?'
+                            r'received', output)
+        if not packets:
+            result['error'] = output.strip()
+            continue
+
+        result['sent'] = int(packets.group(1))
+        result['received'] = int(packets.group(2))
+        if result['sent']:
+            result['loss'] = 100.0 * (result['sent'] - result['received']) / \
+                result['sent']
+        rtt = re.search(r'= ([\d.]+)/([\d.]+)/([\d.]+)', output)
+        if rtt:
+            result['rtt_min'], result['rtt_avg'], result['rtt_max'] = \
+                [float(value) for value in rtt.groups()]
+
+    return results
+
 
 def main():
     module = AnsibleModule(
         argument_spec=dict(
-            host=dict(required=True, type='str'),
-        )
+            host=dict(required=False, type='str'),
+            hosts=dict(required=False, type='list'),
+            count=dict(required=False, type='int', default=1),
+            timeout=dict(required=False, type='float', default=1),
+        ),
+        required_one_of=[['host', 'hosts']],
+        mutually_exclusive=[['host', 'hosts']],
     )
 
     host = module.params.pop('host')
-    result = module.run_command('ping -c 1 {}'.format(host))
-    failed = (result[0] != 0)
-    msg = result[1] if result[1] else result[2]
+    hosts = [host] if host else module.params.get('hosts')
+    # Keep order of hosts, ping each one only once
+    hosts = [h for i, h in enumerate(hosts) if h not in hosts[:i]]
+
+    count = module.params.get('count')
+    timeout = module.params.get('timeout')
+    try:
+        icmp_socket = open_socket()
+    except socket.error:
+        # Not allowed to open ICMP sockets, ping processes are
+        results = ping_processes(hosts, count, timeout)
+    else:
+        results = sweep(hosts, count, timeout, icmp_socket)
+
+    # Hosts that could not be pinged at all come with the reason
+    unreachable = ['{} ({})'.format(h, results[h]['error'])
+                   if 'error' in results[h] else h
+                   for h in hosts if results[h]['received'] == 0]
+    failed = len(unreachable) > 0
+    if failed:
+        msg = 'Hosts not reachable: {}'.format(', '.join(unreachable))
+    else:
+        msg = 'All {} hosts reachable.'.format(len(hosts))
 
-    module.exit_json(changed=False, failed=failed, msg=msg)
+    module.exit_json(changed=False, failed=failed, msg=msg, results=results)
 
 
 if __name__ == '__main__':
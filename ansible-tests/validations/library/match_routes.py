@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+import socket
+import struct
+
+from ansible.module_utils.basic import *
+
+DOCUMENTATION = '''
+---
+module: match_routes
+short_description: Match remote addresses with locally routed networks
+description:
+    - Read the IPv4 routing table of the host once and find the most
+      specific local network (longest prefix match) of each address.
+      The default route is not used for matching.
+    - Returns the matched addresses and the default gateway as targets
+      for icmp_ping. Addresses outside of local networks (unmatched) and
+      addresses that are not IPv4 addresses (invalid, e.g. IPv6 addresses
+      or hostnames) are reported separately.
+options:
+    addresses:
+        required: true
+        description:
+            - List of IPv4 addresses, empty items are skipped
+        type: list
+    routes:
+        required: false
+        default: /proc/net/route
+        description:
+            - Path to the routing table in /proc/net/route format
+        type: str
+'''
+
+EXAMPLES = '''
+- hosts: compute
+  tasks:
+    - name: Match controller IPs with local networks
+      match_routes:
+        addresses:
+          - "{{ controller_ctlplane_ip_address | default }}"
+          - "{{ controller_internal_api_ip_address | default }}"
+      register: routes
+    - name: Ping controller IPs and default gateway
+      icmp_ping: hosts={{ routes.targets }}
+'''
+
+RTF_UP = 0x1
+RTF_GATEWAY = 0x2
+
+
+def hex_address(value):
+    '''Address in /proc/net/route (hex, host byte order) as integer.'''
+    return struct.unpack('!I', struct.pack('=I', int(value, 16)))[0]
+
+
+def parse_address(address):
+    '''Address as integer, None unless it is an IPv4 address.'''
+    try:
+        return struct.unpack('!I', socket.inet_pton(socket.AF_INET,
+                                                    address))[0]
+    except (socket.error, TypeError, ValueError):
+        return None
+
+
+def format_network(network, prefixlen):
+    return '{}/{}'.format(socket.inet_ntoa(struct.pack('!I', network)),
+                          prefixlen)
+
+
+def read_routes(path):
+    '''Return list of (network, prefixlen, gateway, interface) of up routes.
+
+    network is an integer, gateway is None for directly connected networks.
+    '''
+    routes = []
+    with open(path) as routes_file:
+        # Skip the header line
+        for line in list(routes_file)[1:]:
+            fields = line.split()
+            if len(fields) < 8:
+                continue
+            flags = int(fields[3], 16)
+            if not flags & RTF_UP:
+                continue
+
+            mask = hex_address(fields[7])
+            prefixlen = bin(mask).count('1')
+            gateway = None
+            if flags & RTF_GATEWAY:
+                gateway = socket.inet_ntoa(
+                    struct.pack('!I', hex_address(fields[2])))
+            routes.append((hex_address(fields[1]) & mask, prefixlen, gateway,
+                           fields[0]))
+    return routes
+
+
+class RouteTable(object):
+    '''Longest prefix match over routes indexed by prefix length.'''
+
+    def __init__(self, routes):
+        self.prefixes = {}  # {prefixlen: {network: route}}
+        for route in routes:
+            # The first route of the same network wins, as in the kernel
+            self.prefixes.setdefault(route[1], {}).setdefault(route[0], route)
+        self.lengths = sorted(self.prefixes, reverse=True)
+
+    def match(self, value):
+        '''Return the most specific route of address (integer), None without
+        match.
+        '''
+        for prefixlen in self.lengths:
+            mask = (0xffffffff << (32 - prefixlen)) & 0xffffffff
+            route = self.prefixes[prefixlen].get(value & mask)
+            if route is not None:
+                return route
+        return None
+
+
+def match_routes(addresses, routes):
+    '''Return ({address: local network}, unmatched, invalid, default gateway).
+
+    Addresses are matched in one pass over unique addresses. Unmatched are
+    addresses outside of local networks, invalid are addresses that are not
+    IPv4 addresses, both in order of addresses.
+    '''
+    table = RouteTable([r for r in routes if r[1] > 0])
+    default_gateway = next((r[2] for r in routes if r[1] == 0 and r[2]), None)
+
+    matched = {}
+    unmatched = []
+    invalid = []
+    for address in addresses:
+        if (not address or address in matched or address in unmatched or
+                address in invalid):
+            continue
+        value = parse_address(address)
+        if value is None:
+            invalid.append(address)
+            continue
+        route = table.match(value)
+        if route is not None:
+            matched[address] = format_network(route[0], route[1])
+        else:
+            unmatched.append(address)
+
+    return matched, unmatched, invalid, default_gateway
+
+
+def main():
+    module = AnsibleModule(argument_spec=dict(
+        addresses=dict(required=True, type='list'),
+        routes=dict(required=False, type='str', default='/proc/net/route'),
+    ))
+
+    addresses = [a for a in module.params.get('addresses') if a]
+    try:
+        routes = read_routes(module.params.get('routes'))
+        matched, unmatched, invalid, default_gateway = match_routes(addresses,
+                                                                    routes)
+    except (IOError, ValueError) as e:
+        module.fail_json(msg='Could not match routes: {}'.format(e))
+
+    # Keep order of addresses, the default gateway is pinged last
+    targets = [a for i, a in enumerate(addresses)
+               if a in matched and a not in addresses[:i]]
+    if default_gateway is not None and default_gateway not in targets:
+        targets.append(default_gateway)
+
+    module.exit_json(changed=False, matched=matched, unmatched=unmatched,
+                     invalid=invalid, default_gateway=default_gateway,
+                     targets=targets)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+
+import errno
+import os
+import shutil
+import socket
+import stat
+import struct
+import tempfile
+import time
+import unittest
+
+import icmp_ping
+
+# ping stub, the last argument (address) decides about the replies
+PING = '''#!/bin/sh
+for address; do :; done
+sleep 0.5
+case $address in
+    192.0.2.1)
+        echo "2 packets transmitted, 2 received, 0% packet loss, time 1001ms"
+        echo "rtt min/avg/max/mdev = 0.100/0.200/0.300/0.100 ms"
+        exit 0;;
+    192.0.2.2)
+        echo "2 packets transmitted, 0 received, 100% packet loss, time 1001ms"
+        exit 1;;
+    *)
+        echo "connect: Network is unreachable"
+        exit 2;;
+esac
+'''
+
+
+class FakeSocket(object):
+    '''Datagram ICMP socket answering echo requests of reachable hosts.'''
+
+    def __init__(self, reachable, unreachable=()):
+        self.reachable = reachable
+        self.unreachable = unreachable
+        self.replies = []
+        self.closed = False
+        # select() waits on the pipe, it is readable while replies are queued
+        self.read_fd, self.write_fd = os.pipe()
+
+    def fileno(self):
+        return self.read_fd
+
+    def sendto(self, packet, address):
+        if address[0] in self.unreachable:
+            raise socket.error(errno.ENETUNREACH,
+                               os.strerror(errno.ENETUNREACH))
+        if address[0] in self.reachable:
+            seq = struct.unpack('!H', packet[6:8])[0]
+            reply = struct.pack('!BBHHH', icmp_ping.ICMP_ECHO_REPLY, 0, 0,
+                                0, seq)
+            self.replies.append((reply, address))
+            os.write(self.write_fd, b'x')
+
+    def recvfrom(self, size):
+        os.read(self.read_fd, 1)
+        return self.replies.pop(0)
+
+    def close(self):
+        self.closed = True
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+class TestSweep(unittest.TestCase):
+
+    def sweep(self, sock, hosts, count=1):
+        return icmp_ping.sweep(hosts, count, 0.05, (sock, False))
+
+    def test_reachable(self):
+        sock = FakeSocket(['192.0.2.1', '192.0.2.2'])
+        results = self.sweep(sock, ['192.0.2.1', '192.0.2.2'], 2)
+        for host in ['192.0.2.1', '192.0.2.2']:
+            self.assertEqual(2, results[host]['sent'])
+            self.assertEqual(2, results[host]['received'])
+            self.assertEqual(0.0, results[host]['loss'])
+            self.assertIsNotNone(results[host]['rtt_avg'])
+        self.assertTrue(sock.closed)
+
+    def test_no_reply(self):
+        results = self.sweep(FakeSocket([]), ['192.0.2.1'])
+        self.assertEqual(1, results['192.0.2.1']['sent'])
+        self.assertEqual(0, results['192.0.2.1']['received'])
+        self.assertEqual(100.0, results['192.0.2.1']['loss'])
+        self.assertIsNone(results['192.0.2.1']['rtt_avg'])
+        self.assertNotIn('error', results['192.0.2.1'])
+
+    def test_send_error(self):
+        sock = FakeSocket(['192.0.2.1'], ['192.0.2.2'])
+        results = self.sweep(sock, ['192.0.2.2', '192.0.2.1'], 2)
+
+        self.assertEqual(0, results['192.0.2.2']['sent'])
+        self.assertEqual(0, results['192.0.2.2']['received'])
+        self.assertEqual(100.0, results['192.0.2.2']['loss'])
+        self.assertIn(os.strerror(errno.ENETUNREACH),
+                      results['192.0.2.2']['error'])
+
+        # Other hosts are pinged as usual
+        self.assertEqual(2, results['192.0.2.1']['received'])
+        self.assertNotIn('error', results['192.0.2.1'])
+
+
+class TestPingProcesses(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        ping = os.path.join(self.directory, 'ping')
+        with open(ping, 'w') as stub:
+            stub.write(PING)
+        os.chmod(ping, stat.S_IRWXU)
+
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.directory + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.directory)
+
+    def test_results(self):
+        start = time.time()
+        results = icmp_ping.ping_processes(
+            ['192.0.2.1', '192.0.2.2', '192.0.2.3'], 2)
+        # Each ping takes 0.5 s, they run at once
+        self.assertLess(time.time() - start, 1.2)
+
+        self.assertEqual(2, results['192.0.2.1']['received'])
+        self.assertEqual(0.0, results['192.0.2.1']['loss'])
+        self.assertEqual(0.2, results['192.0.2.1']['rtt_avg'])
+        self.assertEqual(2, results['192.0.2.2']['sent'])
+        self.assertEqual(0, results['192.0.2.2']['received'])
+        self.assertIsNone(results['192.0.2.2']['rtt_avg'])
+        self.assertNotIn('error', results['192.0.2.2'])
+        self.assertEqual(0, results['192.0.2.3']['received'])
+        self.assertEqual('connect: Network is unreachable',
+                         results['192.0.2.3']['error'])
+
+    def test_no_ping(self):
+        empty = os.path.join(self.directory, 'empty')
+        os.mkdir(empty)
+        os.environ['PATH'] = empty
+        results = icmp_ping.ping_processes(['192.0.2.1'])
+        self.assertEqual(0, results['192.0.2.1']['received'])
+        self.assertIn('Could not run ping', results['192.0.2.1']['error'])
+
+
+class TestPackets(unittest.TestCase):
+
+    def test_echo_request_checksum(self):
+        self.assertEqual(0, icmp_ping.checksum(icmp_ping.echo_request(1, 2)))
+
+    def test_parse_reply_raw(self):
+        reply = struct.pack('!BBHHH', icmp_ping.ICMP_ECHO_REPLY, 0, 0, 7, 3)
+        ip_header = b'\x45' + b'\x00' * 19
+        self.assertEqual(3, icmp_ping.parse_reply(ip_header + reply, True, 7))
+        self.assertIsNone(icmp_ping.parse_reply(ip_header + reply, True, 8))
+
+    def test_parse_reply_other_type(self):
+        request = icmp_ping.echo_request(7, 3)
+        self.assertIsNone(icmp_ping.parse_reply(request, False, 7))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import match_routes
+
+# /proc/net/route, addresses are hexadecimal in host (little endian) order
+ROUTES = '''\
+Iface	Destination	Gateway 	Flags	RefCnt	Use	Metric	Mask		MTU	Window	IRTT
+eth0	00000000	0102000A	0003	0	0	100	00000000	0	0	0
+eth0	0002000A	00000000	0001	0	0	100	00FFFFFF	0	0	0
+eth1	0000A8C0	00000000	0001	0	0	0	0000FFFF	0	0	0
+eth2	0014A8C0	00000000	0001	0	0	0	00FFFFFF	0	0	0
+eth3	0000A8C0	00000000	0000	0	0	0	00FFFFFF	0	0	0
+eth0	001E0A0A	0101000A	0003	0	0	0	00FFFFFF	0	0	0
+'''
+
+
+class TestMatchRoutes(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, 'route')
+        with open(path, 'w') as routes_file:
+            routes_file.write(ROUTES)
+        self.routes = match_routes.read_routes(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_routes(self):
+        self.assertEqual(5, len(self.routes))
+        self.assertIn((0, 0, '10.0.2.1', 'eth0'), self.routes)
+        self.assertIn((0x0a0a1e00, 24, '10.0.1.1', 'eth0'), self.routes)
+
+    def test_longest_prefix(self):
+        matched, unmatched, invalid, gateway = match_routes.match_routes(
+            ['192.168.20.5', '192.168.1.5', '10.0.2.15', '10.10.30.1'],
+            self.routes)
+        self.assertEqual({'192.168.20.5': '192.168.20.0/24',
+                          '192.168.1.5': '192.168.0.0/16',
+                          '10.0.2.15': '10.0.2.0/24',
+                          '10.10.30.1': '10.10.30.0/24'}, matched)
+        self.assertEqual([], unmatched)
+        self.assertEqual([], invalid)
+        self.assertEqual('10.0.2.1', gateway)
+
+    def test_unmatched(self):
+        matched, unmatched, invalid, gateway = match_routes.match_routes(
+            ['172.16.0.1', '10.0.2.15', '172.16.0.1'], self.routes)
+        self.assertEqual({'10.0.2.15': '10.0.2.0/24'}, matched)
+        self.assertEqual(['172.16.0.1'], unmatched)
+        self.assertEqual([], invalid)
+
+    def test_invalid(self):
+        addresses = ['fd00::1', 'controller.example.com', '10.0.2', '',
+                     '10.0.2.15']
+        matched, unmatched, invalid, gateway = match_routes.match_routes(
+            addresses, self.routes)
+        self.assertEqual({'10.0.2.15': '10.0.2.0/24'}, matched)
+        self.assertEqual([], unmatched)
+        self.assertEqual(['fd00::1', 'controller.example.com', '10.0.2'],
+                         invalid)
+
+    def test_no_default_route(self):
+        routes = [r for r in self.routes if r[1] > 0]
+        matched, unmatched, invalid, gateway = match_routes.match_routes(
+            ['10.0.2.15'], routes)
+        self.assertIsNone(gateway)
+
+
+if __name__ == '__main__':
+    unittest.main()
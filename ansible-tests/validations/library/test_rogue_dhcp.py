@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'files'))
+
+import rogue_dhcp  # noqa
+
+
+def add_interface(sysfs, name, state, link_type, address):
+    os.mkdir(os.path.join(sysfs, name))
+    for attribute, value in (('operstate', state), ('type', link_type),
+                             ('address', address)):
+        with open(os.path.join(sysfs, name, attribute), 'w') as f:
+            f.write(value + '\n')
+
+
+def offer(discover, server_mac, server_ip='192.0.2.1',
+          message_type=rogue_dhcp.DHCP_OFFER, options=b''):
+    # DHCPDISCOVER of the probe turned into answer of the server
+    frame = bytearray(discover)
+    frame[6:12] = server_mac
+    frame[14 + 12:14 + 16] = socket.inet_aton(server_ip)
+    frame[34:38] = struct.pack('!HH', 67, 68)
+    frame[42] = rogue_dhcp.BOOTP_REPLY
+    end = len(frame) - 1
+    return (bytes(frame[:end - 1]) + struct.pack('!B', message_type) +
+            options + struct.pack('!B', rogue_dhcp.DHCP_END))
+
+
+class FakeSocket(object):
+    '''Raw socket of interface where servers answer DHCPDISCOVER.
+
+    Servers are (delay in seconds, ip, mac), the offer of each one arrives
+    on the socket that many seconds after the discover is sent.
+    '''
+
+    def __init__(self, servers):
+        self.servers = servers
+        self.timers = []
+        self.closed = False
+        # select() waits on the probe end, servers write to the other one
+        self.probe, self.network = socket.socketpair(socket.AF_UNIX,
+                                                     socket.SOCK_DGRAM)
+
+    def fileno(self):
+        return self.probe.fileno()
+
+    def send(self, frame):
+        for delay, ip, mac in self.servers:
+            timer = threading.Timer(delay, self.network.send,
+                                    [offer(frame, mac, ip)])
+            timer.start()
+            self.timers.append(timer)
+
+    def recv(self, size):
+        return self.probe.recv(size)
+
+    def close(self):
+        self.closed = True
+        for timer in self.timers:
+            timer.cancel()
+        for timer in self.timers:
+            timer.join()
+        self.probe.close()
+        self.network.close()
+
+
+class TestUpInterfaces(unittest.TestCase):
+
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.sysfs)
+
+    def add_interface(self, name, state, link_type, address):
+        add_interface(self.sysfs, name, state, link_type, address)
+
+    def test_ethernet_up(self):
+        self.add_interface('eth0', 'up', '1', '52:54:00:12:34:56')
+        self.add_interface('eth1', 'down', '1', '52:54:00:12:34:57')
+        self.add_interface('br0', 'unknown', '1', '52:54:00:12:34:58')
+        self.assertEqual(['br0', 'eth0'], rogue_dhcp.up_interfaces(self.sysfs))
+
+    def test_other_links(self):
+        self.add_interface('lo', 'unknown', '772', '00:00:00:00:00:00')
+        self.add_interface('tun0', 'unknown', '65534', '')
+        self.add_interface('ib0', 'up', '32',
+                           '80:00:02:08:fe:80:00:00:00:00:00:00:00:02:c9:'
+                           '03:00:0a:bc:de')
+        self.assertEqual([], rogue_dhcp.up_interfaces(self.sysfs))
+
+    def test_invalid_address(self):
+        self.add_interface('eth0', 'up', '1', '')
+        self.add_interface('eth1', 'up', '1', '52:54:00:12:34')
+        self.assertEqual([], rogue_dhcp.up_interfaces(self.sysfs))
+
+    def test_missing_attribute(self):
+        os.mkdir(os.path.join(self.sysfs, 'eth0'))
+        self.assertEqual([], rogue_dhcp.up_interfaces(self.sysfs))
+
+    def test_ethernet_mac(self):
+        self.add_interface('eth0', 'up', '1', '52:54:00:12:34:56')
+        self.assertEqual(bytearray(b'\x52\x54\x00\x12\x34\x56'),
+                         rogue_dhcp.ethernet_mac('eth0', self.sysfs))
+
+
+class TestParseOffer(unittest.TestCase):
+
+    mac = bytearray(b'\x52\x54\x00\x12\x34\x56')
+    server_mac = b'\x52\x54\x00\xab\xcd\xef'
+
+    def offer(self, xid, message_type=rogue_dhcp.DHCP_OFFER, options=b''):
+        return offer(rogue_dhcp.dhcp_discover(self.mac, xid),
+                     self.server_mac, message_type=message_type,
+                     options=options)
+
+    def test_offer(self):
+        self.assertEqual(('192.0.2.1', '52:54:00:ab:cd:ef'),
+                         rogue_dhcp.parse_offer(self.offer(42), 42))
+
+    def test_server_identifier(self):
+        options = (struct.pack('!BB', rogue_dhcp.DHCP_SERVER_ID, 4) +
+                   socket.inet_aton('192.0.2.2'))
+        self.assertEqual(('192.0.2.2', '52:54:00:ab:cd:ef'),
+                         rogue_dhcp.parse_offer(self.offer(42, options=options),
+                                                42))
+
+    def test_other_transaction(self):
+        self.assertIsNone(rogue_dhcp.parse_offer(self.offer(42), 43))
+
+    def test_other_message(self):
+        self.assertIsNone(rogue_dhcp.parse_offer(self.offer(42, 5), 42))
+
+    def test_discover(self):
+        self.assertIsNone(rogue_dhcp.parse_offer(
+            rogue_dhcp.dhcp_discover(self.mac, 42), 42))
+
+    def test_short_frame(self):
+        self.assertIsNone(rogue_dhcp.parse_offer(b'\xff' * 20, 42))
+
+
+class TestFindDhcpServers(unittest.TestCase):
+
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        add_interface(self.sysfs, 'eth0', 'up', '1', '52:54:00:12:34:56')
+        add_interface(self.sysfs, 'eth1', 'up', '1', '52:54:00:12:34:57')
+        self.sockets = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.sysfs)
+
+    def find(self, servers, timeout_sec, quiet_sec):
+        '''Probe interfaces of servers {interface: [servers]}.
+
+        Return found servers and seconds the probe took.
+        '''
+        for interface in servers:
+            self.sockets[interface] = FakeSocket(servers[interface])
+
+        start = time.time()
+        found = rogue_dhcp.find_dhcp_servers(
+            sorted(servers), timeout_sec, quiet_sec,
+            lambda interface: self.sockets[interface], self.sysfs)
+        elapsed = time.time() - start
+
+        for sock in self.sockets.values():
+            self.assertTrue(sock.closed)
+        return found, elapsed
+
+    def test_no_server(self):
+        found, elapsed = self.find({'eth0': []}, 10, 0.2)
+        self.assertEqual([], found)
+        # Ends after the quiet period, long before the timeout
+        self.assertGreaterEqual(elapsed, 0.2)
+        self.assertLess(elapsed, 2)
+
+    def test_more_servers(self):
+        found, elapsed = self.find(
+            {'eth0': [(0.05, '192.0.2.1', b'\x52\x54\x00\x00\x00\x01'),
+                      (0.1, '192.0.2.2', b'\x52\x54\x00\x00\x00\x02'),
+                      (0.15, '192.0.2.1', b'\x52\x54\x00\x00\x00\x01')],
+             'eth1': [(0.05, '192.0.2.3', b'\x52\x54\x00\x00\x00\x03')]},
+            10, 0.3)
+        # Repeated offer of the same server is reported once
+        self.assertEqual(
+            [('192.0.2.1', '52:54:00:00:00:01', 'eth0'),
+             ('192.0.2.2', '52:54:00:00:00:02', 'eth0'),
+             ('192.0.2.3', '52:54:00:00:00:03', 'eth1')],
+            sorted(found))
+        self.assertLess(elapsed, 2)
+
+    def test_quiet_period_grows(self):
+        # Quiet period of 0.3 s becomes doubled time of the first offer
+        # (0.4 s), so the second offer is still received after 0.5 s and
+        # the period grows again (1.1 s)
+        found, elapsed = self.find(
+            {'eth0': [(0.2, '192.0.2.1', b'\x52\x54\x00\x00\x00\x01'),
+                      (0.55, '192.0.2.2', b'\x52\x54\x00\x00\x00\x02')]},
+            10, 0.3)
+        self.assertEqual(['192.0.2.1', '192.0.2.2'],
+                         [server[0] for server in found])
+        self.assertGreaterEqual(elapsed, 1.6)
+        self.assertLess(elapsed, 5)
+
+    def test_timeout(self):
+        # New server answers every 0.1 s, the quiet period never passes
+        servers = [(0.1 * i, '192.0.2.%d' % i,
+                    b'\x52\x54\x00\x00\x00' + struct.pack('!B', i))
+                   for i in range(1, 50)]
+        found, elapsed = self.find({'eth0': servers}, 0.5, 0.3)
+        self.assertGreaterEqual(elapsed, 0.5)
+        self.assertLess(elapsed, 2)
+        self.assertGreater(len(found), 2)
+        self.assertLess(len(found), len(servers))
+
+
+if __name__ == '__main__':
+    unittest.main()
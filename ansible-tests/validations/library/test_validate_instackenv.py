@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+import validate_instackenv as validation
+
+# ipmitool stub, the -H address decides whether the node answers
+IPMITOOL = '''#!/bin/sh
+while [ $# -gt 0 ]; do [ "$1" = "-H" ] && address=$2; shift; done
+case $address in
+    192.0.2.1*) sleep 0.5; exit 0;;
+    192.0.2.2*) exec sleep 30;;
+    *) exit 1;;
+esac
+'''
+
+
+class TestContactNodes(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        ipmitool = os.path.join(self.directory, 'ipmitool')
+        with open(ipmitool, 'w') as stub:
+            stub.write(IPMITOOL)
+        os.chmod(ipmitool, stat.S_IRWXU)
+
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.directory + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.directory)
+
+    def nodes(self, *addresses):
+        return [(address, 'admin', 'password') for address in addresses]
+
+    def test_reachable(self):
+        self.assertEqual({'192.0.2.10': True, '192.0.3.1': False},
+                         validation.contact_nodes(
+                             self.nodes('192.0.2.10', '192.0.3.1')))
+
+    def test_concurrent(self):
+        addresses = ['192.0.2.1{}'.format(i) for i in range(6)]
+        start = time.time()
+        reachable = validation.contact_nodes(self.nodes(*addresses), 6)
+        # Six nodes answering in 0.5 s each are contacted at once
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(dict((a, True) for a in addresses), reachable)
+
+    def test_timeout(self):
+        start = time.time()
+        reachable = validation.contact_nodes(
+            self.nodes('192.0.2.20', '192.0.2.10'), 2, 1)
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual({'192.0.2.20': False, '192.0.2.10': True},
+                         reachable)
+
+    def test_invalid_concurrency(self):
+        for concurrency in (0, -1):
+            self.assertRaises(ValueError, validation.contact_nodes,
+                              self.nodes('192.0.2.10'), concurrency)
+
+    def test_no_ipmitool(self):
+        empty = os.path.join(self.directory, 'empty')
+        os.mkdir(empty)
+        os.environ['PATH'] = empty
+        self.assertEqual({'192.0.3.1': True},
+                         validation.contact_nodes(self.nodes('192.0.3.1')))
+
+    def test_validate_instackenv(self):
+        nodes = [{'pm_type': 'pxe_ipmitool', 'pm_addr': address,
+                  'pm_user': 'admin', 'pm_password': 'password',
+                  'mac': [mac]}
+                 for address, mac in (('192.0.2.10', '52:54:00:00:00:01'),
+                                      ('192.0.3.1', '52:54:00:00:00:02'),
+                                      ('192.0.3.1', '52:54:00:00:00:02'))]
+        path = os.path.join(self.directory, 'instackenv.json')
+        with open(path, 'w') as instackenv:
+            json.dump({'nodes': nodes}, instackenv)
+
+        errors, reachable = validation.validate_instackenv(path, 2, 5)
+        self.assertEqual({'192.0.2.10': True, '192.0.3.1': False}, reachable)
+        self.assertEqual(["Could not connect to the '192.0.3.1' node.",
+                          'Baremetals IPs are not all unique.',
+                          'MAC addresses are not all unique.'], errors)
+
+
+if __name__ == '__main__':
+    unittest.main()
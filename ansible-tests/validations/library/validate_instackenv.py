@@ -4,6 +4,8 @@ import json
 import os.path
 import subprocess
 import sys
+import threading
+from multiprocessing.pool import ThreadPool
 
 from ansible.module_utils.basic import *
 
@@ -13,25 +15,61 @@ def unique(collection):
     return len(collection) == len(set(collection))
 
 
-def contact_node(address, username, password):
+def contact_node(address, username, password, timeout=None):
     '''Try to connect to the node using `ipmitool`.
 
     Returns `False` on failure and `True` on success or when `ipmitool` is not
-    available (this check is optional).
+    available (this check is optional). `ipmitool` is killed when it runs
+    longer than `timeout` seconds, which counts as a failure.
     '''
     cmd = ['ipmitool', '-R', '1', '-I', 'lanplus',
            '-H', address, '-U', username, '-P', password,
-           'chassis' 'status']
+           'chassis', 'status']
     try:
-        status = subprocess.call(cmd)
-        return status == 0
+        # the module's stdout is its JSON result, keep ipmitool's output away
+        with open(os.devnull, 'w') as devnull:
+            process = subprocess.Popen(cmd, stdout=devnull, stderr=devnull)
     except OSError:
         # the `ipmitool` command is not available. Since it's optional, treat
         # this as a success.
         return True
 
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+    try:
+        status = process.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+    return status == 0
+
+
+def contact_nodes(nodes, concurrency=10, timeout=None):
+    '''Contact nodes by a pool of `concurrency` workers.
+
+    `nodes` is a list of (address, username, password), returns a dictionary
+    {address: reachable}.
+    '''
+    if concurrency < 1:
+        raise ValueError('concurrency must be a positive number')
+    if not nodes:
+        return {}
 
-def validate_instackenv(instackenv_path):
+    pool = ThreadPool(min(concurrency, len(nodes)))
+    try:
+        results = pool.map(lambda node: contact_node(*node, timeout=timeout),
+                           nodes, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return dict((node[0], result) for node, result in zip(nodes, results))
+
+
+def validate_instackenv(instackenv_path, concurrency=10, timeout=None):
+    '''Returns tuple (errors, {IPMI address: reachable}).'''
     with open(instackenv_path, 'r') as net_file:
         env_data = json.load(net_file)
 
@@ -39,6 +77,7 @@ def validate_instackenv(instackenv_path):
 
     maclist = []
     baremetal_ips = []
+    baremetal_nodes = []
     for node in env_data['nodes']:
         try:
             if len(node['pm_password']) == 0:
@@ -62,11 +101,18 @@ def validate_instackenv(instackenv_path):
 
         if node['pm_type'] == "pxe_ipmitool":
             baremetal_ips.append(node['pm_addr'])
-            # Identified baremetal node, try to contact it with ipmitool
-            if not contact_node(
-                    node['pm_addr'], node['pm_user'], node['pm_password']):
-                errors.append(
-                    "Could not connect to the '{}' node.".format(node['pm_addr']))
+            # Identified baremetal node, contact it with ipmitool below
+            baremetal_nodes.append(
+                (node['pm_addr'], node['pm_user'], node['pm_password']))
+
+    # Nodes are contacted concurrently, each only once
+    unique_nodes = [n for i, n in enumerate(baremetal_nodes)
+                    if n[0] not in [m[0] for m in baremetal_nodes[:i]]]
+    reachable = contact_nodes(unique_nodes, concurrency, timeout)
+    for address, username, password in unique_nodes:
+        if not reachable[address]:
+            errors.append(
+                "Could not connect to the '{}' node.".format(address))
 
     if not unique(baremetal_ips):
         errors.append('Baremetals IPs are not all unique.')
@@ -74,29 +120,39 @@ def validate_instackenv(instackenv_path):
     if not unique(maclist):
         errors.append('MAC addresses are not all unique.')
 
-    return errors
+    return errors, reachable
 
 
 def main():
     module = AnsibleModule(argument_spec=dict(
-        path=dict(required=True, type='str')
+        path=dict(required=True, type='str'),
+        concurrency=dict(required=False, type='int', default=10),
+        timeout=dict(required=False, type='int', default=60),
     ))
 
     instackenv_path = module.params.get('path')
 
+    if module.params.get('concurrency') < 1:
+        module.fail_json(msg='The concurrency must be a positive number.')
+    if module.params.get('timeout') < 1:
+        module.fail_json(msg='The timeout must be a positive number.')
+
     if not os.path.isfile(instackenv_path):
         module.exit_json(
             changed=True,
             warnings=["Could not find file '{}'.".format(instackenv_path)],
         )
 
-    errors = validate_instackenv(instackenv_path)
+    errors, reachable = validate_instackenv(
+        instackenv_path, module.params.get('concurrency'),
+        module.params.get('timeout'))
 
     if errors:
-        module.fail_json(msg="\n".join(errors))
+        module.fail_json(msg="\n".join(errors), nodes=reachable)
     else:
         module.exit_json(
-            msg="No errors found for the '{}' file.".format(instackenv_path))
+            msg="No errors found for the '{}' file.".format(instackenv_path),
+            nodes=reachable)
 
 
 if __name__ == '__main__':
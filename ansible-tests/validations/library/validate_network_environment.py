@@ -10,12 +10,17 @@ import six
 
 from ansible.module_utils.basic import *
 
+# Prefer the libyaml C loader, fall back to the pure Python one
+try:
+    YamlLoader = yaml.CSafeLoader
+except AttributeError:
+    YamlLoader = yaml.SafeLoader
 
 def open_network_environment_files(netenv_path):
     errors = []
     try:
         with open(netenv_path, 'r') as net_file:
-            network_data = yaml.load(net_file)
+            network_data = yaml.load(net_file, Loader=YamlLoader)
     except Exception as e:
         return ({}, {}, ["Can't open network environment file '{}': {}"
                          .format(netenv_path, e)])
@@ -28,7 +33,8 @@ def open_network_environment_files(netenv_path):
             try:
                 with open(nic_config_path, 'r') as nic_file:
                     nic_configs.append(
-                        (nic_name, nic_config_path, yaml.load(nic_file)))
+                        (nic_name, nic_config_path,
+                         yaml.load(nic_file, Loader=YamlLoader)))
             except Exception as e:
                 errors.append(
                     "Can't open the resource '{}' reference file '{}': {}"
@@ -422,7 +428,7 @@ def main():
         module.fail_json(msg="\n".join(errors))
     else:
         module.exit_json(msg="No errors found for the '{}' file.".format(
-            netenv_path))
+            netenv_path), yaml_loader=YamlLoader.__name__)
 
 
 if __name__ == '__main__':
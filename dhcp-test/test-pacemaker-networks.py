@@ -1,40 +1,139 @@
 import sys
+import threading
+from collections import namedtuple
 
 from scapy.all import *
 import ipaddress
 
 
-def find_dhcp_servers():
-    conf.checkIPaddr = False
-    fam, hw = get_if_raw_hwaddr(conf.iface)
+# Seconds to wait for offers, all interfaces are probed at the same time
+TIMEOUT = 10
+
+Offer = namedtuple('Offer', ['interface', 'server_ip', 'server_mac',
+                             'offered_ip'])
+
+
+class NetworkIndex(object):
+    """Networks indexed by version and prefix length.
+
+    An address is matched by masking it once per prefix length in use
+    instead of comparing it with every network.
+    """
+
+    def __init__(self, networks):
+        self.prefixes = {}  # {(version, prefixlen): {network int: network}}
+        for network in networks:
+            key = (network.version, network.prefixlen)
+            self.prefixes.setdefault(key, {})[
+                int(network.network_address)] = network
+
+    def lookup(self, ip):
+        """Return networks containing ip, the most specific first."""
+
+        address = ipaddress.ip_address(unicode(ip))
+        found = []
+        for (version, prefixlen), networks in self.prefixes.items():
+            if version != address.version:
+                continue
+            host_bits = address.max_prefixlen - prefixlen
+            network = networks.get(int(address) >> host_bits << host_bits)
+            if network is not None:
+                found.append(network)
+
+        return sorted(found, key=lambda n: -n.prefixlen)
+
+
+def facing_interfaces(networks):
+    """Interfaces routing to one of networks, all interfaces without networks.
+
+    The default interface is used when no route matches.
+    """
+
+    interfaces = []
+    for route in conf.route.routes:
+        net, mask, iface = route[0], route[1], str(route[3])
+        # Default route faces every network
+        if mask == 0 or iface in interfaces or iface == 'lo':
+            continue
+
+        routed = ipaddress.ip_network(u'%s/%s' % (ltoa(net), ltoa(mask)),
+                                      strict=False)
+        if not networks or any(routed.overlaps(n) for n in networks):
+            interfaces.append(iface)
+
+    return interfaces or [conf.iface]
+
+
+def probe_interface(iface, timeout):
+    fam, hw = get_if_raw_hwaddr(iface)
     dhcp_discover = (Ether(dst="ff:ff:ff:ff:ff:ff") /
                      IP(src="0.0.0.0", dst="255.255.255.255") /
                      UDP(sport=68, dport=67) /
                      BOOTP(chaddr=hw) /
                      DHCP(options=[("message-type", "discover"), "end"]))
-    ans, unans = srp(dhcp_discover, multi=True, timeout=10)
+    ans, unans = srp(dhcp_discover, iface=iface, multi=True, timeout=timeout,
+                     verbose=False)
 
-    return [(unicode(packet[1][IP].src), packet[1][Ether].src)
+    return [Offer(iface, unicode(packet[1][IP].src), packet[1][Ether].src,
+                  unicode(packet[1][BOOTP].yiaddr))
             for packet in ans]
 
 
+def find_dhcp_servers(interfaces, timeout=TIMEOUT):
+    """Probe all interfaces in parallel.
+
+    Return tuple (offers, errors), both in interface order. Errors are
+    (interface, exception) of probes that failed.
+    """
+
+    conf.checkIPaddr = False
+    results = {}
+    errors = {}
+
+    def probe(iface):
+        # Exception would only end the thread, it is reported after join
+        try:
+            results[iface] = probe_interface(iface, timeout)
+        except Exception as e:
+            errors[iface] = e
+
+    threads = [threading.Thread(target=probe, args=(iface,))
+               for iface in interfaces]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return ([offer for iface in interfaces for offer in results.get(iface, [])],
+            [(iface, errors[iface]) for iface in interfaces if iface in errors])
+
+
 if __name__ == '__main__':
     result = 0
 
     pacemaker_networks = [ipaddress.ip_network(unicode(net))
                           for net in sys.argv[1:]]
+    index = NetworkIndex(pacemaker_networks)
+    interfaces = facing_interfaces(pacemaker_networks)
+
+    print "Looking for DHCP servers on %s:" % ", ".join(interfaces)
+    dhcp_servers, errors = find_dhcp_servers(interfaces)
 
-    print "Looking for DHCP servers:"
-    dhcp_servers = find_dhcp_servers()
+    for iface, error in errors:
+        print "Could not probe %s: %s" % (iface, error)
+        result = 1
 
     if len(dhcp_servers) > 0:
         print "\nFound DHCP servers:\n"
-        for i, (ip, mac) in enumerate(dhcp_servers):
-            print "%d. %s (mac: %s)" % (i + 1, ip, mac)
-        for network in pacemaker_networks:
-            if network.overlaps(ipaddress.ip_network(ip)):
+        for i, offer in enumerate(dhcp_servers):
+            print "%d. %s (mac: %s) on %s" % (i + 1, offer.server_ip,
+                                              offer.server_mac,
+                                              offer.interface)
+            for network in index.lookup(offer.server_ip):
                 print "\tOverlaps with network %s" % network
                 result = 1
+    elif errors:
+        print "No DHCP servers found on other interfaces."
     else:
         print "No DHCP servers found."
 
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+# File: bench.py
+# Brief: Time and memory benchmark of validator on synthetic template trees
+# Usage: python benchmark/bench.py [--roles N] [--resources N] [--params N] [--depth N]
+#                                  [--unused N] [--repeat N] [--output results.json]
+#                                  [--compare baseline.json] [--threshold T]
+
+from __future__ import with_statement, print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+
+# Validator modules are located in parent directory
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BASE_DIR)
+
+import generate
+import hotvalidator
+import memory
+import yamlloader
+
+# tracemalloc is available since Python 3.4
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Phases of HotValidator.run spent by loading and parsing files
+PARSE_PHASES = ('environments', 'parallel parsing', 'root template', 'mappings')
+
+# Result format, results of different versions are not compared
+VERSION = 2
+
+# Compared results (lower is better)
+METRICS = ('parse', 'validate', 'total', 'peak_memory')
+
+
+def run_validator(template, environments, jobs):
+    ''' Validate tree once, return validator with timings of phases. '''
+
+    arguments = memory.validator_arguments(template, environments)
+    arguments['timings'] = True
+    arguments['jobs'] = jobs
+
+    validator = hotvalidator.HotValidator(arguments)
+    validator.run()
+    return validator
+
+
+def measure(template, environments, repeat, jobs):
+    ''' Validate tree repeat times, return result with the best time of each phase
+        and peak memory of one more run.
+    '''
+
+    phases = {}
+    for i in range(repeat):
+        validator = run_validator(template, environments, jobs)
+        for name, elapsed, files, resources, references, hits in validator.timings:
+            phases[name] = min(phases.get(name, elapsed), elapsed)
+
+    # Size of the tree after the last phase
+    name, elapsed, files, resources, references, hits = validator.timings[-1]
+
+    # Tracing slows the validation down, memory is measured separately
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        run_validator(template, environments, jobs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    parse = sum(t for name, t in phases.items() if name in PARSE_PHASES)
+    total = sum(phases.values())
+
+    return {'files': files,
+            'resources': resources,
+            'references': references,
+            'parse': parse,
+            'validate': total - parse,
+            'total': total,
+            'peak_memory': peak,
+            'phases': phases}
+
+
+def compare(result, baseline, threshold):
+    ''' Print comparison of result with baseline, return list of regressions. '''
+
+    regressions = []
+
+    if (baseline.get('version') != VERSION) or (baseline.get('tree') != result['tree']):
+        print('Baseline was measured on a different tree or by a different version, not compared.')
+        return regressions
+
+    print('{0:<12} {1:>14} {2:>14} {3:>8}'.format('Metric', 'Baseline', 'Current', 'Change'))
+
+    for metric in METRICS:
+        old = baseline.get(metric)
+        new = result.get(metric)
+        if (old is None) or (new is None) or (old == 0):
+            continue
+
+        change = (float(new) - old) / old
+        print('{0:<12} {1:>14.4f} {2:>14.4f} {3:>7.1f}%'.format(metric, old, new, 100 * change) +
+              (' REGRESSION' if change > threshold else ''))
+
+        if change > threshold:
+            regressions.append(metric)
+
+    return regressions
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--roles', type=int, default=20,
+                        help='Number of roles in synthetic tree.')
+    parser.add_argument('--resources', type=int, default=100,
+                        help='Number of resources in synthetic role template.')
+    parser.add_argument('--params', type=int, default=1000,
+                        help='Number of parameters in synthetic role template.')
+    parser.add_argument('--depth', type=int, default=10,
+                        help='Length of get_attr chain of nested templates.')
+    parser.add_argument('--unused', type=int, default=20,
+                        help='Number of mapped templates not used in the tree.')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of processes used for parsing templates.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs, the best time of each phase is used.')
+    parser.add_argument('--output', metavar='path/to/results.json',
+                        help='Store results to file (e.g. as a baseline).')
+    parser.add_argument('--compare', metavar='path/to/baseline.json',
+                        help='Compare results with baseline, exit with 1 on regression.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown reported as regression (default 0.2).')
+    args = parser.parse_args()
+
+    tree = {'roles': args.roles, 'resources': args.resources, 'params': args.params,
+            'depth': args.depth, 'unused': args.unused, 'jobs': args.jobs}
+
+    directory = tempfile.mkdtemp()
+    try:
+        template, environments = generate.generate_tree(directory, args.roles, args.resources,
+                                                        args.params, args.depth, args.unused)
+        result = measure(template, environments, args.repeat, args.jobs)
+    finally:
+        shutil.rmtree(directory)
+
+    result['version'] = VERSION
+    result['tree'] = tree
+    result['python'] = platform.python_version()
+    result['backend'] = yamlloader.BACKEND
+
+    # Print results
+    print('Tree: ' + ', '.join(k + '=' + str(v) for k, v in sorted(tree.items())))
+    print('Files: {0}, resources: {1}, references: {2}'.format(result['files'],
+          result['resources'], result['references']))
+    print('')
+    print('{0:<18} {1:>10}'.format('Phase', 'Time [s]'))
+    for name, elapsed in sorted(result['phases'].items(), key=lambda p: -p[1]):
+        print('{0:<18} {1:>10.4f}'.format(name, elapsed))
+    print('')
+    print('{0:<18} {1:>10.4f}'.format('parse', result['parse']))
+    print('{0:<18} {1:>10.4f}'.format('validate', result['validate']))
+    print('{0:<18} {1:>10.4f}'.format('total', result['total']))
+    print('{0:<18} {1:>10}'.format('peak memory [B]',
+          (result['peak_memory'] if result['peak_memory'] is not None else '-')))
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(result, fd, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+
+        print('')
+        if compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+# File: generate.py
+# Brief: Generator of synthetic HOT template trees for benchmarks
+# Usage: python benchmark/generate.py <directory> [--roles N] [--resources N] [--params N]
+#                                     [--depth N] [--unused N]
+
+from __future__ import with_statement, print_function
+
+import argparse
+import os
+import sys
+
+# Validator modules are located in parent directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import yaml # pip install pyyaml
+
+
+def write_yaml(path, structure):
+    ''' Write structure to YAML file. '''
+
+    with open(path, 'w') as fd:
+        yaml.safe_dump(structure, fd, default_flow_style=False)
+
+
+def generate_tree(directory, roles=10, resources=50, params=100, depth=0, unused=0):
+    ''' Write synthetic tree of templates to directory.
+        Root template contains resource groups of roles. Role types are mapped
+        by a wildcard mapping to node types, each node type is mapped to one
+        role template in environment file.
+        roles - number of roles in root template
+        resources - number of resources in role template
+        params - number of parameters in role template
+        depth - length of chain of nested service templates in role template,
+                outputs are passed up the chain by get_attr
+        unused - number of mapped types (and templates) not used in the tree
+        Return tuple (path to root template, list of paths to environments).
+    '''
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    param_names = ['Param' + str(i) for i in range(params)]
+
+    # Root template - roles are resource groups passing all parameters
+    root = {'heat_template_version': '2015-04-30',
+            'parameters': {},
+            'resources': {},
+            'outputs': {}}
+
+    for name in param_names:
+        root['parameters'][name] = {'type': 'string', 'default': name}
+
+    for i in range(roles):
+        root['parameters']['Role' + str(i) + 'Count'] = {'type': 'number', 'default': 1}
+        root['resources']['Role' + str(i)] = {
+            'type': 'OS::Heat::ResourceGroup',
+            'properties': {
+                'count': {'get_param': 'Role' + str(i) + 'Count'},
+                'resource_def': {
+                    'type': 'OS::Bench::Role' + str(i),
+                    'properties': dict((name, {'get_param': name}) for name in param_names)}}}
+
+        if depth > 0:
+            root['outputs']['Role' + str(i) + 'Service'] = {
+                'value': {'get_attr': ['Role' + str(i), 'service']}}
+
+    # Role template - servers referring parameters and each other
+    role = {'heat_template_version': '2015-04-30',
+            'parameters': dict((name, {'type': 'string'}) for name in param_names),
+            'resources': {},
+            'outputs': {}}
+
+    for i in range(resources):
+        role['resources']['Server' + str(i)] = {
+            'type': 'OS::Nova::Server',
+            'properties': {
+                'name': {'get_param': param_names[i % params]},
+                'image': {'get_param': param_names[(i + 1) % params]},
+                'metadata': {'peer': {'get_resource': 'Server' + str((i + 1) % resources)}}}}
+
+    role['outputs']['servers'] = {
+        'value': [{'get_resource': 'Server' + str(i)} for i in range(resources)]}
+
+    # Chain of services, each one refers to output of the next one
+    if depth > 0:
+        role['resources']['Service'] = {'type': 'service0.yaml',
+                                        'properties': {'name': {'get_param': param_names[0]}}}
+        role['outputs']['service'] = {'value': {'get_attr': ['Service', 'value']}}
+
+    for i in range(depth):
+        service = {'heat_template_version': '2015-04-30',
+                   'parameters': {'name': {'type': 'string'}},
+                   'resources': {},
+                   'outputs': {}}
+
+        if i < depth - 1:
+            service['resources']['Next'] = {'type': 'service' + str(i + 1) + '.yaml',
+                                            'properties': {'name': {'get_param': 'name'}}}
+            service['outputs']['value'] = {'value': {'get_attr': ['Next', 'value']}}
+        else:
+            service['resources']['Config'] = {'type': 'OS::Heat::Value',
+                                              'properties': {'value': {'get_param': 'name'}}}
+            service['outputs']['value'] = {'value': {'get_attr': ['Config', 'value']}}
+
+        write_yaml(os.path.join(directory, 'service' + str(i) + '.yaml'), service)
+
+    # Environment mapping the roles, wildcard first, then node types
+    registry = {'OS::Bench::Role*': 'OS::Bench::Node*'}
+    for i in range(roles):
+        registry['OS::Bench::Node' + str(i)] = 'role.yaml'
+
+    # Types mapped in environment but never used
+    for i in range(unused):
+        registry['OS::Bench::Unused' + str(i)] = 'unused' + str(i) + '.yaml'
+        write_yaml(os.path.join(directory, 'unused' + str(i) + '.yaml'), role)
+
+    env = {'resource_registry': registry}
+
+    write_yaml(os.path.join(directory, 'root.yaml'), root)
+    write_yaml(os.path.join(directory, 'role.yaml'), role)
+    write_yaml(os.path.join(directory, 'env.yaml'), env)
+
+    return (os.path.join(directory, 'root.yaml'), [os.path.join(directory, 'env.yaml')])
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', metavar='path/to/directory',
+                        help='Directory for generated templates.')
+    parser.add_argument('--roles', type=int, default=10,
+                        help='Number of roles in root template.')
+    parser.add_argument('--resources', type=int, default=50,
+                        help='Number of resources in role template.')
+    parser.add_argument('--params', type=int, default=100,
+                        help='Number of parameters in role template.')
+    parser.add_argument('--depth', type=int, default=0,
+                        help='Length of get_attr chain of nested templates in role template.')
+    parser.add_argument('--unused', type=int, default=0,
+                        help='Number of mapped templates not used in the tree.')
+    args = parser.parse_args()
+
+    root, environments = generate_tree(args.directory, args.roles,
+                                       args.resources, args.params,
+                                       args.depth, args.unused)
+
+    print('reference_validator.py -f ' + root + ''.join(' -e ' + e for e in environments))
+
+if __name__ == '__main__':
+    main()
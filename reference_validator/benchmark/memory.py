@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+# File: memory.py
+# Brief: Memory benchmark of validator model objects (hotclasses)
+# Usage: python benchmark/memory.py [--roles N] [--resources N] [--params N]
+
+from __future__ import with_statement, print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+# Validator modules are located in parent directory
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BASE_DIR)
+
+import generate
+import hotvalidator
+
+# tracemalloc is available since Python 3.4
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Bundled tests (see run_tests.sh), test 2 contains invalid YAML
+TEST_DIR = os.path.join(BASE_DIR, 'tests', 'test_files')
+TESTS = [('01', '01_root.yaml', []),
+         ('03', '03_root.yaml', ['03_env.yaml']),
+         ('04', '04_root.yaml', []),
+         ('05', '05_root.yaml', []),
+         ('06', '06_root.yaml', ['06_env.yaml']),
+         ('07', '07_root.yaml', ['07_env1.yaml', '07_env2.yaml'])]
+
+
+class DictBacked:
+    ''' Object keeping the same attributes in __dict__, used for comparison. '''
+    pass
+
+
+def validator_arguments(template, environments):
+    ''' Arguments of HotValidator as parsed by reference_validator.py. '''
+
+    return {'print_unused': True, 'pretty_format': False, 'print_tree': False,
+            'print_backend': False, 'output_format': 'text', 'jobs': 1, 'cache_file': None,
+            'watch': False, 'timings': False, 'nyan': False, 'parameters': None,
+            'template_file': template, 'environment_file': environments}
+
+
+def footprint(obj):
+    ''' Size of object including its attribute dictionary (if any). '''
+
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size = size + sys.getsizeof(obj.__dict__)
+    return size
+
+
+def dict_footprint(obj):
+    ''' Size of the same object without __slots__. '''
+
+    plain = DictBacked()
+    for attr in obj.__slots__:
+        setattr(plain, attr, getattr(obj, attr, None))
+    return footprint(plain)
+
+
+def model_objects(validator):
+    ''' All hotclasses objects in validated tree, each only once. '''
+
+    objects = {}
+    for env in validator.environments:
+        objects[id(env)] = env
+        for ref in env.invalid:
+            objects[id(ref)] = ref
+
+    for hot in validator.templates + validator.mappings:
+        for obj in hot.resources + hot.params + hot.invalid:
+            objects[id(obj)] = obj
+        for resource in hot.resources:
+            for prop in (resource.properties or []):
+                objects[id(prop)] = prop
+
+    return list(objects.values())
+
+
+def measure(name, template, environments):
+    ''' Validate tree, print memory used by model objects. '''
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+    validator = hotvalidator.HotValidator(validator_arguments(template, environments))
+    validator.run()
+
+    peak = None
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    objects = model_objects(validator)
+    slotted = sum(footprint(obj) for obj in objects)
+    plain = sum(dict_footprint(obj) for obj in objects)
+
+    print('{0:<12} {1:>9} {2:>12} {3:>12} {4:>8} {5:>14}'.format(name, len(objects),
+          plain, slotted, '{0:.1f}%'.format(100.0 * (plain - slotted) / plain if plain else 0),
+          (peak if peak is not None else '-')))
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--roles', type=int, default=20,
+                        help='Number of roles in synthetic tree.')
+    parser.add_argument('--resources', type=int, default=200,
+                        help='Number of resources in synthetic role template.')
+    parser.add_argument('--params', type=int, default=300,
+                        help='Number of parameters in synthetic role template.')
+    args = parser.parse_args()
+
+    print('{0:<12} {1:>9} {2:>12} {3:>12} {4:>8} {5:>14}'.format('Tree', 'Objects',
+          'Dict [B]', 'Slots [B]', 'Saved', 'Peak run [B]'))
+
+    for name, template, environments in TESTS:
+        measure('test ' + name, os.path.join(TEST_DIR, template),
+                [os.path.join(TEST_DIR, e) for e in environments])
+
+    # Synthetic tree
+    directory = tempfile.mkdtemp()
+    try:
+        template, environments = generate.generate_tree(directory, args.roles,
+                                                        args.resources, args.params)
+        measure('synthetic', template, environments)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
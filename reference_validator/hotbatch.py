@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+# File: hotbatch.py
+# Brief: Contains class HotBatch for validating more root templates in one process
+# Classes: HotBatch
+# Functions: read_manifest, validate_root, validate_worker
+
+from __future__ import with_statement, print_function
+
+import os
+import sys
+import six  # compatibility
+
+import hotclasses
+import hotvalidator
+import yamlloader
+
+# Parsed files and compiled registries of worker process, shared by
+# all roots validated in the process (see validate_root)
+worker_state = {}
+
+
+def read_manifest(path):
+    ''' Read list of roots from manifest file.
+        Manifest is a YAML list of roots, paths are relative to the manifest:
+          - template: path/to/root.yaml
+            environments: [path/to/env.yaml, ...]    (optional)
+            parameters: ['KEY1=VALUE1', ...]         (optional)
+        Return list of tuples (template, environments, parameters).
+    '''
+
+    with open(path) as fd:
+        structure = yamlloader.load(fd)
+
+    if type(structure) != list:
+        raise ValueError('manifest ' + path + ' is not a list of roots')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    roots = []
+
+    for item in structure:
+        if (type(item) != dict) or ('template' not in item):
+            raise ValueError('manifest ' + path + ' contains root without template')
+
+        roots.append((os.path.join(directory, item['template']),
+                      [os.path.join(directory, e) for e in (item.get('environments') or [])],
+                      list(item.get('parameters') or [])))
+
+    return roots
+
+
+def validate_root(arguments, root, cache=None, result_cache=None):
+    ''' Validate one root template, return tuple (template, status, output).
+        Output is captured, status is 'OK', 'FAILED' or 'ERROR' (validation
+        did not finish, e.g. invalid YAML).
+        Without cache the parse cache of current process is used.
+    '''
+
+    if cache is None:
+        if 'cache' not in worker_state:
+            worker_state['cache'] = hotclasses.ParseCache()
+        cache = worker_state['cache']
+
+    registries = worker_state.setdefault('registries', {})
+
+    template, environments, parameters = root
+
+    root_arguments = dict(arguments)
+    root_arguments['template_file'] = template
+    root_arguments['environment_file'] = environments
+    root_arguments['parameters'] = parameters or None
+    root_arguments['jobs'] = 1
+    root_arguments['nyan'] = False
+
+    # Output of the root is printed at once, roots are validated in parallel
+    stdout = sys.stdout
+    sys.stdout = six.StringIO()
+    status = 'ERROR'
+
+    try:
+        validator = hotvalidator.HotValidator(root_arguments, cache, result_cache,
+                                              registries)
+        validator.save_results = False
+        validator.run()
+        validator.print_output()
+
+        status = 'OK'
+        if (not all(env.ok and not env.invalid for env in validator.environments) or
+            not all(hot.ok for hot in validator.templates + validator.mappings)):
+            status = 'FAILED'
+
+    except SystemExit:
+        pass
+
+    finally:
+        output = sys.stdout.getvalue()
+        sys.stdout = stdout
+
+    return (template, status, output)
+
+
+def validate_worker(task):
+    ''' Validate root in worker process, task is tuple (arguments, root). '''
+
+    return validate_root(task[0], task[1])
+
+
+class HotBatch:
+    ''' Validate more root templates, each with its own environments
+        and parameters. Parsed files and compiled registries are shared
+        by all roots, with more jobs roots are validated by a pool of
+        worker processes (each sharing them among its roots).
+    '''
+
+    def __init__(self, arguments, roots):
+        ''' arguments - dictionary with parsed arguments and their values
+            roots - list of tuples (template, environments, parameters)
+        '''
+
+        self.arguments = arguments
+        self.roots = roots
+        self.jobs = arguments['jobs']
+        self.results = []
+
+        # Each root would be a separate document
+        if arguments['output_format'] not in ('text', 'jsonl'):
+            print('Only text and jsonl output can be used in batch mode.')
+            sys.exit(1)
+
+        # Document and result cache (-c) is written by one process only
+        self.result_cache = None
+        if arguments['cache_file']:
+            if self.jobs > 1:
+                print('Cache file can not be used with more jobs in batch mode.')
+                sys.exit(1)
+            self.result_cache = hotclasses.ResultCache(arguments['cache_file'])
+
+    def run(self):
+        ''' Validate all roots, results are in order of roots. '''
+
+        if self.jobs > 1:
+            # Imported here, only needed when validating in parallel
+            import multiprocessing
+
+            pool = multiprocessing.Pool(self.jobs)
+            try:
+                self.results = pool.map(validate_worker,
+                                        [(self.arguments, root) for root in self.roots], 1)
+            finally:
+                pool.close()
+                pool.join()
+
+        else:
+            cache = hotclasses.ParseCache(self.result_cache)
+            self.results = [validate_root(self.arguments, root, cache, self.result_cache)
+                            for root in self.roots]
+
+            if self.result_cache is not None:
+                self.result_cache.save()
+
+    def print_output(self):
+        ''' Print output of every root followed by summary. '''
+
+        # Machine-readable records identify their files, no headers
+        text = (self.arguments['output_format'] == 'text')
+
+        for template, status, output in self.results:
+            if text:
+                print('Root template: ' + os.path.relpath(template, os.getcwd()))
+                print('')
+            sys.stdout.write(output)
+            if text:
+                print('')
+
+        if text:
+            failed = [r for r in self.results if r[1] != 'OK']
+            print('Batch:')
+            print('Total: ' + str(len(self.results)))
+            print('Failed: ' + str(len(failed)))
+            for template, status, output in failed:
+                print('- ' + os.path.relpath(template, os.getcwd()) + ' (' + status + ')')
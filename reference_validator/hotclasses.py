@@ -3,17 +3,28 @@
 
 # File: hotclasses.py
 # Brief: Additional classes used for HOT reference validation
-# Classes: Environment, PropertyParamater, InvalidReference, Resource
+# Classes: Environment, PropertyParamater, InvalidReference, Resource, ParseCache, ReferenceTable,
+#          ResultCache, ReferenceMemo, RegistryIndex, ParamIndex
+# Functions: read_document, walk_tree
 # Author: Katerina Pilatova (kpilatov)
 # Date: 2016
 
 from __future__ import with_statement, print_function
 
+import copy
+import hashlib
+import os
+import pickle
+import six  # compatibility
+
 import enum
 
-class Environment:
+class Environment(object):
     ''' Class with attributes needed for work with environment files. '''
 
+    __slots__ = ('path', 'parent', 'children', 'resource_registry', 'params',
+                 'params_default', 'structure', 'invalid', 'ok')
+
     def __init__(self, parent_node, abs_path):
         self.path = abs_path
 
@@ -30,11 +41,13 @@ class Environment:
 
         self.ok = True              # validation status
 
-class PropertyParameter:
+class PropertyParameter(object):
     ''' Class for saving information about parameters and properties.
         Each parameter and its corresponding property share one.
     '''
 
+    __slots__ = ('name', 'used', 'type', 'hidden', 'value', 'default')
+
     def __init__(self, structure, is_par):
         ''' structure - internal structure
             is_par - PropertyParameter object is created either based on
@@ -97,8 +110,15 @@ class PropertyParameter:
         if obj.type is not None:
             self.type = obj.type
 
-class Resource:
-    ''' Store useful info about resource, its structure. '''
+class Resource(object):
+    ''' Store useful info about resource, its structure.
+        Structure is shared by all copies of the resource, properties
+        (per-instance state) are created only when they are needed.
+    '''
+
+    __slots__ = ('name', 'structure', 'type', 'used', 'hotfile', 'child',
+                 'properties', 'props_structure', 'is_group', 'grouptype',
+                 'declared_type')
     def __init__(self, name, value, hot):
         self.name = name                    # name of resource variable
         self.structure = value              # resource structure
@@ -113,7 +133,8 @@ class Resource:
         self.hotfile = hot                  # file containing resource
         self.child = None                   # child node
 
-        self.properties = []                # list of ParProp
+        self.properties = None              # list of ParProp, see get_properties
+        self.props_structure = None         # structure of properties
 
         self.is_group = False # is it a group type
         self.grouptype = ''
@@ -121,9 +142,6 @@ class Resource:
         if self.type in (enum.Grouptypes.ASG, enum.Grouptypes.RG):
             self.is_group = True
 
-        props = []
-
-
         # If there are properties, save them
         if (self.structure is not None) and ('properties' in self.structure):
 
@@ -135,35 +153,569 @@ class Resource:
                     ('resource' in self.structure['properties']) and
                     ('type' in self.structure['properties']['resource'])):
                     self.type = self.structure['properties']['resource']['type']
+                    self.props_structure = self.structure['properties']['resource'].get('properties')
                 elif ((self.grouptype == enum.Grouptypes.RG) and
                       ('resource_def' in self.structure['properties']) and
                       ('type' in self.structure['properties']['resource_def'])):
                     self.type = self.structure['properties']['resource_def']['type']
-                else:
-                    # No properties found
-                    return
+                    self.props_structure = self.structure['properties']['resource_def'].get('properties')
+            else:
+                self.props_structure = self.structure['properties']
+
+        self.declared_type = self.type      # type before mappings are applied
 
-                # Load properties
-                for prop in self.structure['properties'][('resource' if
-                            self.grouptype == enum.Grouptypes.ASG else 'resource_def')]['properties'].items():
+    def get_properties(self):
+        ''' Return list of properties, create it on first use. '''
+
+        if self.properties is None:
+            self.properties = []
+            if self.props_structure is not None:
+                for prop in self.props_structure.items():
                     self.properties.append(PropertyParameter(prop, False))
-            else:
-                if self.structure['properties'] is not None:
-                    for prop in self.structure['properties'].items():
-                        self.properties.append(PropertyParameter(prop, False))
 
-    def clone(self):
-        ''' Create a new deep copy of the object,
+        return self.properties
+
+    def clone(self, hot):
+        ''' Create a new copy of the object for file hot,
             mutable objects such as structure are shared.
+            Mappings, usage and properties are not copied.
         '''
-        new_resource = Resource(self.name, self.structure, self.hotfile)
+        new_resource = copy.copy(self)
+
+        new_resource.type = self.declared_type
+        new_resource.used = False
+        new_resource.hotfile = hot
+        new_resource.child = None
+        new_resource.properties = None
+
         return new_resource
 
-class InvalidReference:
+class InvalidReference(object):
     ''' Save all invalid references for output, used in hotfile. '''
 
-    def __init__(self, referent, element, ref_type, parent):
+    __slots__ = ('referent', 'element', 'type', 'parent', 'position')
+
+    def __init__(self, referent, element, ref_type, parent, position=None):
         self.referent = referent # name of referred element
         self.element = element   # in which resource was reference realized
         self.type = ref_type     # type of referred attribute (ErrorTypes)
         self.parent = parent     # used in property reference
+        self.position = position # (line, column) of reference in file or None
+
+def read_document(path, parse, store=None):
+    ''' Read and parse file, return tuple (mtime, size, structure, digest, marks).
+        path - absolute path to the file
+        parse - function parsing file content (string) into tuple
+                (structure, marks), see yamlloader.load_marked
+        store - optional ResultCache with already parsed documents
+    '''
+
+    stat = os.stat(path)
+    with open(path, 'r') as fd:
+        content = fd.read()
+
+    # Digest of file content identifies the document across runs
+    digest = hashlib.sha1(content.encode('utf-8') if isinstance(content, six.text_type)
+                          else content).hexdigest()
+
+    if (store is not None) and store.has_document(digest):
+        structure, marks = store.get_document(digest)
+    else:
+        structure, marks = parse(content)
+
+    return (stat.st_mtime, stat.st_size, structure, digest, marks)
+
+def walk_tree(nodes, children, pre=None, post=None):
+    ''' Depth-first traversal using explicit stack instead of recursion,
+        so that depth of the tree is not limited by recursion limit.
+        nodes - iterable of root nodes, traversed in order
+        children - function returning iterable of child nodes, it is called
+                   after pre hook of the node and consumed lazily (work done
+                   by a generator between children keeps the order of
+                   recursive traversal)
+        pre - function called when node is entered, returning False skips
+              its subtree (post hook is not called either)
+        post - function called when the whole subtree of node is traversed
+    '''
+
+    stack = [(None, iter(nodes))]
+
+    while stack:
+        node, pending = stack[-1]
+
+        for child in pending:
+            if (pre is None) or (pre(child) is not False):
+                stack.append((child, iter(children(child))))
+                break
+        else:
+            # All children traversed, node (if not the pseudo root) is done
+            stack.pop()
+            if (post is not None) and stack:
+                post(node)
+
+class ParseCache:
+    ''' Parsed YAML documents shared by all nodes of one validation run.
+        Each file is keyed by its absolute path, entries are valid as long
+        as modification time and size of the file stay the same.
+    '''
+
+    def __init__(self, store=None):
+        self.documents = {}         # {absolute path: (mtime, size, structure, digest, marks)}
+        self.tables = {}            # {absolute path: (digest, ReferenceTable)}
+        self.paths = set()          # all requested paths, including failed ones
+        self.store = store          # persistent ResultCache (optional)
+        self.hits = 0               # number of loads served from the cache
+        self.misses = 0             # number of files actually parsed
+
+    def add(self, abs_path, entry):
+        ''' Store parsed document.
+            abs_path - absolute path to the file
+            entry - tuple (mtime, size, structure, digest, marks) from read_document
+        '''
+
+        self.misses = self.misses + 1
+        self.documents[abs_path] = entry
+
+        if self.store is not None:
+            self.store.add_document(entry[3], (entry[2], entry[4]))
+
+    def load(self, path, parse):
+        ''' Return parsed structure of file on path.
+            path - path to the file
+            parse - function parsing file content (string) into tuple
+                    (structure, marks), see yamlloader.load_marked
+            IOError and parsing errors are propagated to the caller.
+        '''
+
+        abs_path = os.path.abspath(path)
+        self.paths.add(abs_path)
+        stat = os.stat(abs_path)
+
+        entry = self.documents.get(abs_path)
+        if (entry is not None) and (entry[0] == stat.st_mtime) and (entry[1] == stat.st_size):
+            self.hits = self.hits + 1
+
+            # Keep the document in persistent store
+            if self.store is not None:
+                self.store.add_document(entry[3], (entry[2], entry[4]))
+            return entry[2]
+
+        entry = read_document(abs_path, parse, self.store)
+        self.add(abs_path, entry)
+        return entry[2]
+
+    def digest(self, path):
+        ''' Return content digest of already loaded file. '''
+
+        return self.documents[os.path.abspath(path)][3]
+
+    def references(self, path):
+        ''' Return ReferenceTable of already loaded file, each version
+            of the file is compiled only once.
+        '''
+
+        abs_path = os.path.abspath(path)
+        entry = self.documents[abs_path]
+
+        table = self.tables.get(abs_path)
+        if (table is None) or (table[0] != entry[3]):
+            table = (entry[3], ReferenceTable(entry[2], entry[4]))
+            self.tables[abs_path] = table
+
+        return table[1]
+
+class ReferenceTable(object):
+    ''' References of one file extracted in a single pass over its structure.
+        Entries of references are lists [function, argument, instance name,
+        location, end, position] in order of occurrence, location is a tuple
+        of keys and indices from section to the function (e.g. ('resources',
+        'Controller', 'properties', 'name', 'get_param')), position is
+        a tuple (line, column) or None. Entries in range (index + 1, end)
+        are nested in the argument of the entry, they are validated only
+        when the entry itself cannot be resolved.
+        Dependencies are tuples (dependency, resource name, position).
+    '''
+
+    __slots__ = ('references', 'dependencies')
+
+    FUNCTIONS = ('get_param', 'get_resource', 'get_attr')
+
+    def __init__(self, structure, marks=None):
+        ''' structure - parsed file
+            marks - positions of keys from loader (see yamlloader.MarkedLoader)
+        '''
+
+        self.references = []
+        self.dependencies = []
+
+        if type(structure) != dict:
+            return
+
+        # {(mapping id, key) : (line, column)}
+        positions = dict(((id(m[0]), m[1]), (m[2], m[3])) for m in (marks or []))
+
+        # Sections with nested structures
+        for section, instances in six.iteritems(structure):
+            if type(instances) == dict:
+                for name, value in six.iteritems(instances):
+                    self.extract(name, value, (section, name), positions)
+
+        # Resources which resources depend on
+        resources = structure.get('resources')
+        if type(resources) == dict:
+            for name, value in sorted(six.iteritems(resources)):
+                if (type(value) != dict) or ('depends_on' not in value):
+                    continue
+
+                if type(value['depends_on']) == str:
+                    dependencies = [value['depends_on']]
+                elif type(value['depends_on']) == list:
+                    dependencies = value['depends_on']
+                else:
+                    continue
+
+                position = positions.get((id(value), 'depends_on'))
+                for d in dependencies:
+                    self.dependencies.append((d, name, position))
+
+    def extract(self, name, structure, location, positions):
+        ''' Add references in structure of instance name. '''
+
+        references = self.references
+
+        # Nodes are tuples (structure, location, index of entry or None)
+        def children(node):
+            structure, location = node[0], node[1]
+
+            if isinstance(structure, list):
+                for index, item in enumerate(structure):
+                    if isinstance(item, dict) or isinstance(item, list):
+                        yield (item, location + (index,), None)
+
+            elif isinstance(structure, dict):
+                for key, value in six.iteritems(structure):
+                    if key in self.FUNCTIONS:
+                        references.append([key, value, name, location + (key,), None,
+                                           positions.get((id(structure), key))])
+                        yield (value, location + (key,), len(references) - 1)
+                    elif isinstance(value, dict) or isinstance(value, list):
+                        yield (value, location + (key,), None)
+
+        # Range of entry ends after its nested references
+        def leave(node):
+            if node[2] is not None:
+                references[node[2]][4] = len(references)
+
+        walk_tree([(structure, location, None)], children, post=leave)
+
+class ResultCache:
+    ''' Persistent cache of parsed documents and validation results
+        of files, used for incremental re-validation.
+        Documents are keyed by content digest, results by node key
+        (see HotValidator.compute_keys). Only entries used in the last
+        run are kept. Without path the cache lives only in memory.
+    '''
+
+    VERSION = 3                     # format of the cache file
+
+    def __init__(self, path):
+        self.path = path
+
+        self.documents = {}         # {content digest: (structure, marks)}
+        self.results = {}           # {node key: result record}
+
+        self.used_documents = set() # digests used in current run
+        self.used_results = set()   # node keys used in current run
+
+        self.hits = 0               # number of files with reused results
+
+        if self.path is None:
+            return
+
+        # Missing, unreadable or outdated cache file means empty cache
+        try:
+            with open(self.path, 'rb') as fd:
+                data = pickle.load(fd)
+            if data.get('version') == self.VERSION:
+                self.documents = data['documents']
+                self.results = data['results']
+        except Exception:
+            pass
+
+    def has_document(self, digest):
+        return digest in self.documents
+
+    def get_document(self, digest):
+        self.used_documents.add(digest)
+        return self.documents[digest]
+
+    def add_document(self, digest, document):
+        self.used_documents.add(digest)
+        self.documents[digest] = document
+
+    def get_result(self, key):
+        ''' Return result record for node key or None. '''
+
+        return self.results.get(key)
+
+    def use_result(self, key):
+        ''' Result record for node key is reused. '''
+
+        self.used_results.add(key)
+        self.hits = self.hits + 1
+
+    def add_result(self, key, record):
+        self.used_results.add(key)
+        self.results[key] = record
+
+    def save(self):
+        ''' Drop entries not used in the last run, write the rest
+            to the cache file.
+        '''
+
+        self.documents = dict((k, self.documents[k]) for k in self.used_documents)
+        self.results = dict((k, self.results[k]) for k in self.used_results)
+
+        self.used_documents = set()
+        self.used_results = set()
+
+        if self.path is None:
+            return
+
+        data = {'version': self.VERSION,
+                'documents': self.documents,
+                'results': self.results}
+
+        # Write to temporary file first so that the cache is never left broken
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as fd:
+            pickle.dump(data, fd, 2)
+        os.rename(tmp_path, self.path)
+
+class DeferredReference(Exception):
+    ''' Resolution of references is nested too deep (ReferenceMemo.MAX_DEPTH),
+        the reference is resolved on its own first, see HotFile.resolve.
+    '''
+
+    def __init__(self, hot, key, hierarchy, name):
+        Exception.__init__(self, key)
+        self.reference = (hot, key, hierarchy, name)
+
+class ReferenceMemo:
+    ''' Results of get_param/get_attr resolution shared by the whole tree
+        during validation. Invalid references created while resolving are
+        stored as well and added again for every referring instance.
+        Resolution is recorded (invalid references, parameters and resources
+        marked as used, visited files), nested resolutions are linked as
+        entries, so that validation of a file can be stored in result cache
+        and replayed (see start and stop).
+        Entries are looked up and stored by HotFile.classify_items, so that
+        the memo adds no stack frames to chains of references.
+    '''
+
+    MAX_DEPTH = 100                 # nested resolutions, deeper references are deferred
+
+    def __init__(self):
+        self.results = {}           # {(file id, function, hierarchy): (value, invalid, used, visited, nested)}
+        self.recordings = []        # [[invalid, used, visited, nested entries]] in progress
+        self.active = set()         # keys of resolutions in progress (reference cycles)
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        ''' Start recording resolution or validation of a file. '''
+
+        self.recordings.append([[], [], set(), []])
+
+    def discard(self):
+        ''' Drop recording of resolution that did not finish. '''
+
+        self.recordings.pop()
+
+    def store(self, memo_key, value, name):
+        ''' Stop recording resolution, store its result.
+            Invalid references are passed to enclosing recording, the entry
+            is linked to it.
+        '''
+
+        invalid, used, visited, nested = self.recordings.pop()
+        self.misses = self.misses + 1
+
+        # Element of invalid reference always starts with instance name,
+        # only the rest is stored
+        entry = (value,
+                 [(hot, InvalidReference(ref.referent, ref.element[len(name):],
+                                         ref.type, ref.parent))
+                  for hot, ref in invalid],
+                 used, visited, nested)
+        self.results[memo_key] = entry
+
+        if self.recordings:
+            self.recordings[-1][0].extend(invalid)
+            self.recordings[-1][3].append(entry)
+
+    def replay(self, entry, name):
+        ''' Reuse stored entry for instance name, return its value. '''
+
+        self.hits = self.hits + 1
+
+        # Report errors again for current instance
+        for hot, ref in entry[1]:
+            hot.add_invalid(InvalidReference(ref.referent, name + ref.element,
+                                             ref.type, ref.parent))
+
+        if self.recordings:
+            self.recordings[-1][3].append(entry)
+
+        return entry[0]
+
+    def stop(self):
+        ''' Stop recording validation of a file, return tuple (effects, visited files).
+            Effects are tuples ('invalid', file, InvalidReference) and
+            ('param' or 'resource', file, name) including all linked entries.
+        '''
+
+        invalid, used, visited, nested = self.recordings.pop()
+
+        effects = [('invalid', hot, ref) for hot, ref in invalid]
+        used = set(used)
+        visited = set(visited)
+
+        # Entries are shared by many resolutions, each one is collected once
+        seen = set()
+        pending = list(nested)
+        while pending:
+            entry = pending.pop()
+            if id(entry) in seen:
+                continue
+            seen.add(id(entry))
+
+            used.update(entry[2])
+            visited.update(entry[3])
+            pending.extend(entry[4])
+
+        effects.extend((kind, hot, name) for hot, kind, name in used)
+
+        return (effects, visited)
+
+    def record(self, hot, ref):
+        ''' Remember invalid reference of file hot. '''
+
+        if self.recordings:
+            self.recordings[-1][0].append((hot, ref))
+
+    def used(self, hot, kind, name):
+        ''' Remember parameter or resource (kind) of file hot marked as used. '''
+
+        if self.recordings:
+            self.recordings[-1][1].append((hot, kind, name))
+
+    def visit(self, hot):
+        ''' Remember file hot is visited. '''
+
+        if self.recordings:
+            self.recordings[-1][2].add(hot)
+
+class RegistryIndex:
+    ''' Compiled resource_registry of all environment files.
+        Exact origins are kept in dictionary, wildcard origins ('prefix*',
+        '*suffix') in prefix and suffix tries, so finding a mapping does not
+        depend on registry size. When more mappings match, the first one
+        (in order of environment files and their registries) is used.
+    '''
+
+    def __init__(self):
+        self.exact = {}             # {origin : [(order, origin, mapped)]}
+        self.prefixes = {}          # trie of 'prefix*' origins
+        self.suffixes = {}          # trie of '*suffix' origins (reversed)
+        self.size = 0               # number of mappings
+
+    def add(self, origin, mapped):
+        ''' Add mapping, mapped is either type/file or [file, resource name]. '''
+
+        entry = (self.size, origin, mapped)
+        self.size = self.size + 1
+
+        if origin.startswith('*'):
+            self.insert(self.suffixes, origin[:0:-1], entry)
+        elif origin.endswith('*'):
+            self.insert(self.prefixes, origin[:-1], entry)
+        else:
+            self.exact.setdefault(origin, []).append(entry)
+
+    def insert(self, trie, key, entry):
+        ''' Insert entry into trie under key. '''
+
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(entry)
+
+    def walk(self, trie, key, found):
+        ''' Add entries of all trie keys that are prefixes of key to found. '''
+
+        node = trie
+        found.extend(node.get(None, []))
+
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return
+            found.extend(node.get(None, []))
+
+    def match(self, resource_type, name=None):
+        ''' Find mapping applicable to resource type.
+            resource_type - current type of resource
+            name - resource name, mappings designated for other resources are skipped
+            Return tuple (origin, mapped) or None.
+        '''
+
+        if not isinstance(resource_type, six.string_types):
+            return None
+
+        found = list(self.exact.get(resource_type, []))
+        self.walk(self.prefixes, resource_type, found)
+        self.walk(self.suffixes, resource_type[::-1], found)
+
+        best = None
+        for entry in found:
+            if (type(entry[2]) == list) and (entry[2][1] != name):
+                continue
+            if (best is None) or (entry[0] < best[0]):
+                best = entry
+
+        return (None if best is None else (best[1], best[2]))
+
+class ParamIndex:
+    ''' Parameter flow of the tree of templates. Parameter name is mapped
+        to all files declaring it, edges are resources passing their
+        properties to parameters of child file (parent, resource, child)
+        in order of DFS. Environment parameters and defaults are matched
+        by one lookup instead of going through all files.
+    '''
+
+    def __init__(self):
+        self.declarations = {}      # {name : [(HotFile, PropertyParameter)]}
+        self.edges = []             # [(parent HotFile, Resource, child HotFile)]
+
+    def add_file(self, hot):
+        ''' Index parameters declared in file. '''
+
+        for p in hot.params:
+            self.add_param(hot, p)
+
+    def add_param(self, hot, param):
+        ''' Index parameter declared in file. '''
+
+        self.declarations.setdefault(param.name, []).append((hot, param))
+
+    def add_edge(self, resource):
+        ''' Add resource with child file, index parameters of the child. '''
+
+        self.edges.append((resource.hotfile, resource, resource.child))
+        self.add_file(resource.child)
+
+    def declared(self, name):
+        ''' Return list of (file, parameter) declaring name. '''
+
+        return self.declarations.get(name, [])
@@ -13,10 +13,34 @@ from __future__ import with_statement, print_function
 import os
 import sys
 import six  # compatibility
-import yaml # pip install pyyaml
 
 import enum
 import hotclasses
+import yamlloader
+
+
+def find_name(index, name):
+    ''' Look name up in index, unhashable names (nested structures)
+        are never found.
+    '''
+
+    try:
+        return index.get(name)
+    except TypeError:
+        return None
+
+
+def parse_template(path):
+    ''' Parse template in a worker process.
+        Return tuple (path, entry), entry is None if the file cannot be read
+        or parsed - the error is then reported when the file is loaded.
+        path - absolute path to the file
+    '''
+
+    try:
+        return (path, hotclasses.read_document(path, yamlloader.load_marked))
+    except Exception:
+        return (path, None)
 
 
 class HotFile:
@@ -33,12 +57,23 @@ class HotFile:
         self.params = []            # list of PropertyParameter
                                     # TODO exception for root template when checking properties values
 
+        self.resource_index = {}    # {name : Resource}
+        self.param_index = {}       # {name : PropertyParameter}
+
         self.outputs = {}           # {name : <value structure>}
 
         self.structure = {}         # structure of YAML file
+        self.references = None      # ReferenceTable of structure
         self.ok = True
 
+        self.digest = None          # digest of file content
+        self.memo = None            # ReferenceMemo shared by the tree during validation
+        self.cache_key = None       # key in persistent result cache
+        self.tree_id = None         # identity of file in the tree (result cache)
+
         self.invalid = []           # list of invalid references (Reference)
+        self.position = None        # (line, column) of reference being validated
+        self.invalid_keys = set()   # identities of invalid references, see add_invalid
 
 
     def clone_file(self, new_parent):
@@ -47,30 +82,100 @@ class HotFile:
         '''
         new_file = HotFile(new_parent, self.path)
 
-        # create new instances of property/parameter objects
+        # resources share their structure, properties are created on demand
         for r in self.resources:
-            new_file.resources.append(r.clone())
+            new_file.add_resource(r.clone(new_file))
 
+        # parameters hold per-instance state (usage, merged values)
         for p in self.params:
-            new_file.params.append(p.clone())
+            new_file.add_param(p.clone())
 
         new_file.outputs = self.outputs # outputs section remains
         new_file.structure = self.structure # the file structure remains
+        new_file.references = self.references
+        new_file.digest = self.digest
         # ok and invalid do not need to be changed
 
         return new_file
 
-    def load_file(self, curr_nodes, templates, environments, curr_path):
-        ''' Validate YAML file. '''
+    def add_resource(self, resource):
+        ''' Append resource and index it by its name. '''
 
-        # Add current node at the beginning
-        curr_nodes.append(self)
+        self.resources.append(resource)
+        self.resource_index[resource.name] = resource
+
+    def add_param(self, param):
+        ''' Append parameter and index it by its name. '''
+
+        self.params.append(param)
+        self.param_index[param.name] = param
 
-        # Open file
+    def mark_used(self, kind, name):
+        ''' Mark parameter or resource (kind) of file as used. '''
+
+        item = (self.param_index if kind == 'param' else self.resource_index).get(name)
+        if item is not None:
+            item.used = True
+
+        if self.memo is not None:
+            self.memo.used(self, kind, name)
+
+    def add_invalid(self, ref):
+        ''' Add invalid reference unless the same one is already added,
+            file is not valid anymore.
+        '''
+
+        # Reference found invalid while validating this file points to the file
+        if ref.position is None:
+            ref.position = self.position
+
+        key = (str(ref.referent), ref.element, ref.type, ref.parent)
+        if key not in self.invalid_keys:
+            self.invalid_keys.add(key)
+            self.invalid.append(ref)
+
+        self.ok = False
+
+        if self.memo is not None:
+            self.memo.record(self, ref)
+
+    def load_file(self, curr_nodes, templates, environments, cache):
+        ''' Validate YAML file and the whole subtree of its children.
+            cache - ParseCache shared by all files in the tree
+        '''
+
+        def enter(hot):
+            curr_nodes.append(hot)
+            hot.read_file(cache)
+
+        def leave(hot):
+            curr_nodes.remove(hot)
+
+        def children(hot):
+            # Examine children nodes to get the full information about references,
+            # children are relative to their parent
+            for resource in hot.resources:
+                if (resource.type is not None) and (resource.type.endswith('.yaml')):
+                    templates.append(HotFile(hot, os.path.abspath(os.path.join(
+                                     os.path.dirname(hot.path), resource.type))))
+
+                    # Add child, it is loaded before the next one is created
+                    resource.child = templates[-1]
+                    yield templates[-1]
+
+        hotclasses.walk_tree([self], children, enter, leave)
+
+    def read_file(self, cache):
+        ''' Parse file, save its parameters, resources and outputs.
+            cache - ParseCache shared by all files in the tree
+        '''
+
+        # Open file, each file is parsed only once per run
         try:
-            with open(os.path.join(curr_path, self.path), 'r') as fd:
-                self.structure = yaml.load(fd.read())
-        except IOError:
+            self.structure = cache.load(self.path, yamlloader.load_marked)
+            self.digest = cache.digest(self.path)
+            self.references = cache.references(self.path)
+        except (IOError, OSError):
             print('File ' + self.path + ' could not be opened.', file=sys.stderr)
             sys.exit(1)
         except Exception as err:
@@ -85,94 +190,128 @@ class HotFile:
         # Save all parameters names, resources and properties
         if ('parameters' in self.structure) and (self.structure['parameters'] is not None):
             for param in sorted(self.structure['parameters'].items()):
-                self.params.append(hotclasses.PropertyParameter(param, True))
+                self.add_param(hotclasses.PropertyParameter(param, True))
 
         if ('resources' in self.structure) and (self.structure['resources'] is not None):
             for key, value in sorted(six.iteritems(self.structure['resources'])):
-                self.resources.append(hotclasses.Resource(key, value, self))
+                self.add_resource(hotclasses.Resource(key, value, self))
 
         if ('outputs' in self.structure) and (self.structure['outputs'] is not None):
             for key, value in sorted(six.iteritems(self.structure['outputs'])):
                 self.outputs[key] = value
 
-        # Examine children nodes to get the full information about references
-        for resource in self.resources:
-            if (resource.type is not None) and (resource.type.endswith('.yaml')):
-                templates.append(HotFile(self, resource.type))
-
-                # Add child
-                resource.child = templates[-1]
-
-                # Start validating child
-                templates[-1].load_file(curr_nodes, templates, environments,
-                                       os.path.join(curr_path, os.path.dirname(self.path)))
-
-                # The whole subtree with root = current node is loaded
-
-        # Remove node from current nodes after loading
-        curr_nodes.remove(self)
-
-
     def validate_file(self, curr_nodes):
         ''' After loading information, validate references in file. '''
 
         # Add current node at the beginning
         curr_nodes.append(self)
 
+        if self.memo is not None:
+            self.memo.visit(self)
+
         # If the file is empty
         if self.structure is None:
             return
 
-        # Iterate over sections (all children validated by now)
-        for section, instances in six.iteritems(self.structure):
-            # skip those without nested structures
-            if type(instances) == dict:
+        # Go through references in order of occurrence (all children validated by now)
+        references = self.references.references
+        index = 0
+        while index < len(references):
+            function, argument, name, location, end, self.position = references[index]
 
-                # Iterate over instances (variables)
-                for key, value in six.iteritems(instances):
-                    self.validate_instances(key, value)
+            # Nested references are checked only if the reference is not resolved
+            if self.resolve(function, argument, name) is None:
+                index = index + 1
+            else:
+                index = end
+
+        self.position = None
 
         # Check dependencies
         self.depends_on()
 
-        # Sort invalid messages, remove duplicates
+        # Sort invalid messages
         self.sort_out_invalid()
 
         # Remove node from current nodes after validation
         curr_nodes.remove(self)
 
 
-    def validate_instances(self, name, structure):
-        ''' Check if all references to variables are valid.
-            name       - name of referring instance
-            structure - structure containing instance properties and their values
+    def resolve(self, key, value, name):
+       ''' Resolve reference found in file (see classify_items).
+           Chains of references deeper than ReferenceMemo.MAX_DEPTH are
+           resolved from their far end, each deferred reference is resolved
+           on its own and memoized, then the outer one is resolved again.
+       '''
 
-        '''
+       pending = [(self, key, value, name)]
 
-        if isinstance(structure, list):
-            for s in structure:
-                if isinstance(s, dict) or isinstance(s, list):
-                    self.validate_instances(name, s)
+       while True:
+           hot, key, value, name = pending[-1]
 
-        elif isinstance(structure, dict):
-            # Classify references
-            for key, value in six.iteritems(structure):
-                if self.classify_items(key, value, name) is None:
-                    self.validate_instances(name, value)
+           try:
+               result = hot.classify_items(key, value, name)
+           except hotclasses.DeferredReference as deferred:
+               # Outer reference is still in progress (reference cycles)
+               self.memo.active.add((id(hot), key, repr(value)))
+               pending.append(deferred.reference)
+               continue
+
+           pending.pop()
+           if not pending:
+               return result
+
+           hot, key, value, name = pending[-1]
+           self.memo.active.discard((id(hot), key, repr(value)))
 
 
     def classify_items(self, key, value, name):
-       ''' If item contains reference, it is processed. '''
+       ''' If item contains reference, it is processed.
+           Results of get_param/get_attr are memoized, identical references
+           in this file are resolved only once.
+       '''
+
+       memo = self.memo
+       if memo is not None:
+           memo.visit(self)
 
        if key == 'get_param':
-           return self.get_param(value, name)
+           function = self.get_param
        elif key == 'get_resource':
            return self.get_resource(value, name)
        elif key == 'get_attr':
-           return self.get_attr(value, name)
+           function = self.get_attr
        else:
            return None
 
+       if memo is None:
+           return function(value, name)
+
+       memo_key = (id(self), key, repr(value))
+       entry = memo.results.get(memo_key)
+       if entry is not None:
+           return memo.replay(entry, name)
+
+       # Reference refers to itself through other references
+       if memo_key in memo.active:
+           return None
+
+       if len(memo.recordings) > memo.MAX_DEPTH:
+           raise hotclasses.DeferredReference(self, key, value, name)
+
+       memo.start()
+       memo.active.add(memo_key)
+       try:
+           result = function(value, name)
+       except Exception:
+           memo.discard()
+           raise
+       finally:
+           memo.active.discard(memo_key)
+
+       memo.store(memo_key, result, name)
+       return result
+
 
     def get_param(self, hierarchy, name):
         ''' Validate get_param.
@@ -206,18 +345,17 @@ class HotFile:
             # End unsuccessfully
             elif cur_state == enum.GetParamStates.ERROR:
                 if type(hierarchy) == list:
-                    self.invalid.append(hotclasses.InvalidReference(str(hierarchy[index]),
+                    self.add_invalid(hotclasses.InvalidReference(str(hierarchy[index]),
                                 name, enum.ErrorTypes.GET_PARAM, None))
                 else:
-                    self.invalid.append(hotclasses.InvalidReference(str(hierarchy),
+                    self.add_invalid(hotclasses.InvalidReference(str(hierarchy),
                                 name, enum.ErrorTypes.GET_PARAM, None))
-                self.ok = False
                 return None
 
             # End successfully
             elif cur_state == enum.GetParamStates.RESOLVED:
                 if parameter is not None:
-                    parameter.used = True
+                    self.mark_used('param', parameter.name)
                 return (value if (value is not None) else element)
 
             # Find parameter
@@ -240,10 +378,7 @@ class HotFile:
                     continue
 
                 elif type(element) == str:
-                    for p in self.params:
-                        if p.name == element:
-                            parameter = p
-                            break
+                    parameter = self.param_index.get(element)
 
                 if parameter is None:
                     # Parameter was not found
@@ -332,15 +467,14 @@ class HotFile:
             name - instance name
         '''
 
-        for r in self.resources:
-            if hierarchy == r.name:
-                r.used = True
-                return r
+        r = find_name(self.resource_index, hierarchy)
+        if r is not None:
+            self.mark_used('resource', r.name)
+            return r
 
         # If not found, add it to invalid references
-        self.invalid.append(hotclasses.InvalidReference(hierarchy, name,
+        self.add_invalid(hotclasses.InvalidReference(hierarchy, name,
                             enum.ErrorTypes.GET_RESOURCE, None))
-        self.ok = False
         return None
 
 
@@ -376,20 +510,19 @@ class HotFile:
             elif cur_state == enum.GetAttrStates.ERROR:
 
                 if (type(hierarchy) == list) and (len(hierarchy) > 0):
-                    self.invalid.append(hotclasses.InvalidReference(str(hierarchy[index]),
+                    self.add_invalid(hotclasses.InvalidReference(str(hierarchy[index]),
                                 name + ' - output of ' + str(hierarchy[0]),
                                 enum.ErrorTypes.GET_ATTR, None))
                 else:
-                    self.invalid.append(hotclasses.InvalidReference(hierarchy,
+                    self.add_invalid(hotclasses.InvalidReference(hierarchy,
                                 name + ' - output of ' + str(hierarchy),
                                 enum.ErrorTypes.GET_ATTR, None))
 
-                self.ok = False
                 return None
 
             # End successfully
             elif cur_state == enum.GetAttrStates.RESOLVED:
-                resource.used = True
+                self.mark_used('resource', resource.name)
                 return value
 
             # Resolve first element and its value, choose next state
@@ -404,10 +537,7 @@ class HotFile:
                     next_state = enum.GetAttrStates.ERROR
 
                 elif type(element) == str:
-                    for r in self.resources:
-                        if r.name == element:
-                            resource = value = r
-                            break
+                    resource = value = self.resource_index.get(element)
 
                     # Resource not found
                     if resource is None:
@@ -482,16 +612,13 @@ class HotFile:
 
             # If second element is output name, resolve it
             elif cur_state == enum.GetAttrStates.OUTPUT_NAME:
-                # Go through outputs section of resource file
-                found = False
-                for k, v in six.iteritems(resource.child.outputs):
-                    if element == k:
-                        value = v['value']
-                        found = True
-                        break
+                # Find output in outputs section of resource file
+                output = find_name(resource.child.outputs, element)
+                if output is not None:
+                    value = output['value']
 
                 # Output name not found
-                if not found:
+                if output is None:
                     next_state = enum.GetAttrStates.ERROR
                 else:
                     # If value is a get_
@@ -541,14 +668,10 @@ class HotFile:
 
             # resource.<name>
             elif cur_state == enum.GetAttrStates.RESOURCE:
-                found = False
-                for r in resource.child.resources:
-                    if element == r.name:
-                        value = r
-                        found = True
-                        break
+                value = resource.child.resource_index.get(element)
+
                 # TODO: or can there be smth else?
-                if ((not found) or (len(hierarchy) > (index + 1))):
+                if ((value is None) or (len(hierarchy) > (index + 1))):
                     next_state = enum.GetAttrStates.ERROR
                 else:
                     next_state = enum.GetAttrStates.RESOLVED
@@ -604,39 +727,11 @@ class HotFile:
 
 
     def sort_out_invalid(self):
-        ''' Sort invalid references, remove duplicates
+        ''' Sort invalid references by error type and referent name,
+            references are unique already (see add_invalid).
         '''
 
-        sorted_i = 0 # first index after sorted field
-        tmp = None
-
-        # Sort by ErrorType
-        for err_type in range(1, 9):
-            for i in range(sorted_i, len(self.invalid)):
-                # Move element at the end of sorted area
-                if self.invalid[i].type == err_type:
-                    tmp = self.invalid[i]
-
-                    # Sort it by alphabetical order
-                    for j in range(self.find_index(tmp.type), sorted_i):
-                        if tmp.referent < self.invalid[j].referent:
-                            self.invalid.remove(tmp)
-                            self.invalid.insert(j, tmp)
-                    
-                    sorted_i = sorted_i + 1
-            # Whole list is sorted
-            if sorted_i == len(self.invalid):
-                break
-
-        # TODO: Sort alphabetically within sublists
-        # TODO: Remove duplicates - both identical and semantic
-
-    def find_index(self, err_type):
-        ''' Find index of first element with error type err_type. '''
-
-        for i in range(0, len(self.invalid)):
-            if self.invalid[i].type == err_type:
-                return i
+        self.invalid.sort(key=lambda ref: (ref.type, str(ref.referent)))
 
     def check_prop_par(self, parent, resource, environments):
         ''' Check properties against parameters and vice versa, tag used. '''
@@ -644,68 +739,47 @@ class HotFile:
         # Find all differences - add to invalid references
         # Find all matches - merge into one object
 
+        properties = dict((p.name, p) for p in resource.get_properties())
+
         # Get difference in names of properties and parameters
-        differences = list(set([x.name for x in self.params]) ^ set([y.name for y in resource.properties]))
+        differences = list(set(self.param_index) ^ set(properties))
 
         for diff in differences:
-            found = False
+            param = self.param_index.get(diff)
 
             # Missing property for parameter
-            for p in self.params:
-                if diff == p.name:
-                    found = True
-
-                    # Only if parameter has no default
-                    if p.default is None:
-                        self.invalid.append(hotclasses.InvalidReference(
-                                            diff, resource.name,
-                                            enum.ErrorTypes.MISS_PROP, parent.path))
-                        self.ok = False
-                        break
+            if param is not None:
 
+                # Only if parameter has no default
+                if param.default is None:
+                    self.add_invalid(hotclasses.InvalidReference(
+                                        diff, resource.name,
+                                        enum.ErrorTypes.MISS_PROP, parent.path))
 
             # Missing parameter for property
-            if not found:
-                for p in resource.properties:
-                    if diff == p.name:
-                        self.invalid.append(hotclasses.InvalidReference(
-                                        diff, resource.name,
-                                        enum.ErrorTypes.MISS_PARAM, self.path))
-                        self.ok = False
-                        break
+            else:
+                self.add_invalid(hotclasses.InvalidReference(
+                                diff, resource.name,
+                                enum.ErrorTypes.MISS_PARAM, self.path))
+
+        # Share PropertyParameter for each match, keep order of parameters
+        for name, prop in six.iteritems(properties):
+            param = self.param_index.get(name)
+            if param is not None:
+                prop.merge(param)
+                self.param_index[name] = prop
 
-        # Share PropertyParameter for each match
-        for par in range(len(self.params)):
-            for prop in resource.properties:
-                if self.params[par].name == prop.name:
-                    prop.merge(self.params[par])
-                    self.params[par] = prop
+        self.params = [self.param_index[p.name] for p in self.params]
 
 
     def depends_on(self):
         ''' Set resources which other resources depend on as used. '''
 
-        for r in self.resources:
-            if (r.structure is not None) and ('depends_on' in r.structure):
-                found = False
-                if type(r.structure['depends_on']) == str:
-                    dependencies = [r.structure['depends_on']]
-                elif type(r.structure['depends_on']) == list:
-                    dependencies = r.structure['depends_on']
-                else:
-                    continue
-
-                # Check dependencies
-                for d in dependencies:
-                   for x in self.resources:
-                       if x.name == d:
-                           x.used = True
-                           found = True
-                           break
-
-                   if not found:
-
-                       # Searched resource does not exist
-                       self.invalid.append(hotclasses.InvalidReference(d, r.name,
-                                           enum.ErrorTypes.DEPENDS_ON, None))
-                       self.ok = False
+        for d, name, position in self.references.dependencies:
+            x = find_name(self.resource_index, d)
+            if x is not None:
+                self.mark_used('resource', x.name)
+            else:
+                # Searched resource does not exist
+                self.add_invalid(hotclasses.InvalidReference(d, name,
+                                    enum.ErrorTypes.DEPENDS_ON, None, position))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+# File: hotoutput.py
+# Brief: Machine-readable output of HOT reference validator (json, jsonl, sarif)
+# Classes: StreamOutput
+
+from __future__ import with_statement, print_function
+
+import json
+import os
+
+import enum
+
+# Names of error types used in records and as SARIF rule ids
+ERROR_NAMES = {
+    enum.ErrorTypes.GET_RESOURCE: 'get_resource',
+    enum.ErrorTypes.GET_PARAM: 'get_param',
+    enum.ErrorTypes.GET_ATTR: 'get_attr',
+    enum.ErrorTypes.MISS_PROP: 'missing_property',
+    enum.ErrorTypes.MISS_PARAM: 'missing_parameter',
+    enum.ErrorTypes.DEPENDS_ON: 'depends_on',
+    enum.ErrorTypes.ENV_PARAM: 'env_parameter',
+    enum.ErrorTypes.ENV_PARAM_DEFAULT: 'env_parameter_default',
+}
+
+SARIF_SCHEMA = 'https://raw.githubusercontent.com/oasis-tcs/sarif-spec/master/Schemata/sarif-schema-2.1.0.json'
+
+
+class StreamOutput:
+    ''' Write one record per file and per invalid reference as soon as
+        the result of the file is final.
+        json  - records are items of one JSON list
+        jsonl - one JSON record per line
+        sarif - SARIF 2.1.0 log, invalid references are results
+    '''
+
+    FORMATS = ('json', 'jsonl', 'sarif')
+
+    def __init__(self, output_format, stream, init_dir, print_unused):
+        self.format = output_format
+        self.stream = stream
+        self.init_dir = init_dir
+        self.print_unused = print_unused
+
+        self.first = True           # no record written yet (separators)
+
+    def relpath(self, path):
+        ''' Path relative to initial directory, None stays None. '''
+
+        return (os.path.relpath(path, self.init_dir) if path is not None else None)
+
+    def message(self, ref):
+        ''' Human readable text of invalid reference, same as in text output. '''
+
+        if ref.type == enum.ErrorTypes.GET_RESOURCE:
+            return ('Resource ' + str(ref.referent) + ' referred in ' + ref.element +
+                    ' is not declared.')
+        elif ref.type == enum.ErrorTypes.GET_PARAM:
+            return ('Parameter ' + str(ref.referent) + ' referred in ' + ref.element +
+                    ' is not declared.')
+        elif ref.type == enum.ErrorTypes.GET_ATTR:
+            return ('Instance ' + str(ref.referent) + ' referred by get_attr in ' +
+                    ref.element + ' is not declared.')
+        elif ref.type == enum.ErrorTypes.MISS_PROP:
+            return ('Parameter ' + str(ref.referent) + ' has no corresponding default or property in ' +
+                    ref.element + ' in ' + self.relpath(ref.parent) + '.')
+        elif ref.type == enum.ErrorTypes.MISS_PARAM:
+            return ('Property ' + str(ref.referent) + ' has no corresponding parameter in ' +
+                    self.relpath(ref.parent) + '.')
+        elif ref.type == enum.ErrorTypes.DEPENDS_ON:
+            return ('Resource ' + str(ref.referent) + ' that resource ' + ref.element +
+                    ' depends on is not declared.')
+        elif ref.type == enum.ErrorTypes.ENV_PARAM:
+            return 'Parameter ' + str(ref.referent) + ' has no match in root template.'
+        else:
+            return 'Parameter default ' + str(ref.referent) + ' has no match in the stack.'
+
+    def write(self, record):
+        ''' Write one record, flush it immediately. '''
+
+        if self.format == 'jsonl':
+            self.stream.write(json.dumps(record, sort_keys=True) + '\n')
+        else:
+            self.stream.write(('\n' if self.first else ',\n') +
+                              json.dumps(record, sort_keys=True))
+        self.first = False
+        self.stream.flush()
+
+    def start(self):
+        ''' Write beginning of the document. '''
+
+        if self.format == 'json':
+            self.stream.write('[')
+        elif self.format == 'sarif':
+            rules = [{'id': ERROR_NAMES[t]} for t in sorted(ERROR_NAMES)]
+            self.stream.write('{"$schema": ' + json.dumps(SARIF_SCHEMA) +
+                              ', "version": "2.1.0", "runs": [{"tool": {"driver": ' +
+                              json.dumps({'name': 'reference_validator', 'rules': rules},
+                                         sort_keys=True) +
+                              '}, "results": [')
+        self.stream.flush()
+
+    def finish(self):
+        ''' Write end of the document. '''
+
+        if self.format == 'json':
+            self.stream.write('\n]\n')
+        elif self.format == 'sarif':
+            self.stream.write('\n]}]}\n')
+        self.stream.flush()
+
+    def reference(self, path, ref):
+        ''' Write record of invalid reference in file on path. '''
+
+        if self.format == 'sarif':
+            location = {'artifactLocation': {'uri': self.relpath(path)}}
+            if ref.position is not None:
+                location['region'] = {'startLine': ref.position[0],
+                                      'startColumn': ref.position[1]}
+
+            self.write({'ruleId': ERROR_NAMES[ref.type],
+                        'level': ('warning' if ref.type == enum.ErrorTypes.ENV_PARAM_DEFAULT
+                                  else 'error'),
+                        'message': {'text': self.message(ref)},
+                        'locations': [{'physicalLocation': location}]})
+        else:
+            self.write({'record': 'invalid_reference',
+                        'file': self.relpath(path),
+                        'line': (ref.position[0] if ref.position is not None else None),
+                        'column': (ref.position[1] if ref.position is not None else None),
+                        'error': ERROR_NAMES[ref.type],
+                        'referent': str(ref.referent),
+                        'element': ref.element,
+                        'parent': self.relpath(ref.parent),
+                        'message': self.message(ref)})
+
+    def environment(self, env):
+        ''' Write records of environment file and its invalid references. '''
+
+        for ref in env.invalid:
+            self.reference(env.path, ref)
+
+        if self.format != 'sarif':
+            self.write({'record': 'environment',
+                        'file': self.relpath(env.path),
+                        'invalid': len(env.invalid),
+                        'status': ('OK' if (env.ok and not env.invalid) else 'FAILED')})
+
+    def hot_file(self, node):
+        ''' Write records of validated HOT file and its invalid references. '''
+
+        for ref in node.invalid:
+            self.reference(node.path, ref)
+
+        if self.format == 'sarif':
+            return
+
+        record = {'record': 'file',
+                  'file': self.relpath(node.path),
+                  'parent': (self.relpath(node.parent.path) if node.parent is not None else None),
+                  'invalid': len(node.invalid),
+                  'unused_parameters': sorted(p.name for p in node.params if not p.used),
+                  'status': ('OK' if node.ok else 'FAILED')}
+
+        if self.print_unused:
+            record['hidden_parameters'] = sorted(p.name for p in node.params if p.hidden)
+            record['unused_resources'] = sorted(r.name for r in node.resources if not r.used)
+
+        self.write(record)
+
+    def unused_mapping(self, node):
+        ''' Write record of mapped file no resource is mapped to (not loaded). '''
+
+        if self.format != 'sarif':
+            self.write({'record': 'unused_mapping',
+                        'file': self.relpath(node.path),
+                        'environment': self.relpath(node.parent.path)})
@@ -8,16 +8,18 @@
 
 from __future__ import with_statement, print_function
 
+import hashlib
 import os
 import pprint
 import sys
 import six  # compatibility
-import time
-import yaml # pip install pyyaml
+import timeit
 
 import enum
 import hotfile
 import hotclasses
+import hotoutput
+import yamlloader
 
 # import nyanbar if available
 try:
@@ -28,9 +30,13 @@ except ImportError:
 class HotValidator:
     ''' Detect unused variables, invalid references. '''
 
-    def __init__(self, arguments):
+    def __init__(self, arguments, cache=None, result_cache=None, registries=None):
         ''' Find *.yaml files based on entered arguments.
             arguments - dictionary with parsed arguments and their values
+            cache - ParseCache kept from previous runs (optional)
+            result_cache - ResultCache kept from previous runs (optional)
+            registries - compiled registries shared by more runs (optional),
+                         see build_registry
         '''
 
         # in environments, mappings, templates: all nodes with references to parent/children
@@ -45,17 +51,51 @@ class HotValidator:
         self.templates = []
         self.parameters = {}
 
+        # Mappings from all environments, see build_registry
+        self.registry = hotclasses.RegistryIndex()
+        self.registries = registries
+
         # Currently opened nodes
         self.curr_nodes = []
 
+        # Documents and results from previous runs (-c)
+        # (results are saved after the run unless the owner saves them)
+        self.result_cache = result_cache
+        self.save_results = True
+        if (self.result_cache is None) and arguments['cache_file']:
+            self.result_cache = hotclasses.ResultCache(arguments['cache_file'])
+
+        # Parsed YAML documents, shared across the whole tree
+        self.cache = cache
+        if self.cache is None:
+            self.cache = hotclasses.ParseCache(self.result_cache)
+
         # Applied parameters
         self.print_unused = arguments['print_unused']
         self.pretty_format = arguments['pretty_format']
         self.print_structure = arguments['print_tree']
+        self.print_backend = arguments['print_backend']
+        self.output_format = arguments['output_format']
+        self.jobs = arguments['jobs']
         self.print_nyan = nyanbar and arguments['nyan']
-        self.sleep_time = 0.3
+        self.print_timings = arguments['timings']
         self.printer = pprint.PrettyPrinter(indent=2)
 
+        # Phases of run (--timings), see phase_done
+        self.timings = []           # [(phase, seconds, files, resources, references, cache hits)]
+        self.phase_start = None
+        self.progress = None        # nyanbar
+        self.memo = None            # ReferenceMemo of validation
+        self.tree_files = {}        # {tree identity : HotFile}, see compute_keys
+        self.param_flow = None      # ParamIndex of the tree
+
+        # Machine-readable output (--format), text is printed by print_output
+        self.output = None
+        if self.output_format in hotoutput.StreamOutput.FORMATS:
+            self.output = hotoutput.StreamOutput(self.output_format, sys.stdout,
+                                                 self.init_dir, self.print_unused)
+            self.print_nyan = False
+
         # Check HOT file (-f)
         abs_path = os.path.abspath(arguments['template_file'])
         if abs_path.endswith('yaml'):
@@ -97,9 +137,8 @@ class HotValidator:
 
         for env_node in self.environments:
             try:
-                with open(env_node.path, 'r') as fd:
-                    env_node.structure = yaml.load(fd.read())
-            except IOError:
+                env_node.structure = self.cache.load(env_node.path, yamlloader.load_marked)
+            except (IOError, OSError):
                 print('File ' + env_node.path + ' could not be opened.')
                 sys.exit(1)
             except Exception as err:
@@ -113,10 +152,13 @@ class HotValidator:
             if env_node.structure is None:
                 continue
 
-            # Save mappings
+            # Save mappings, mapped files are relative to the environment
+            env_dir = os.path.dirname(env_node.path)
             if ('resource_registry' in env_node.structure) and (env_node.structure['resource_registry'] is not None):
                 for origin, custom in six.iteritems(env_node.structure['resource_registry']):
                     if type(custom) == str:
+                        if custom.endswith('.yaml'):
+                            custom = os.path.abspath(os.path.join(env_dir, custom))
                         env_node.resource_registry[origin] = custom
                     elif origin == 'resources':
 
@@ -127,7 +169,8 @@ class HotValidator:
 
                                 # Add indirect mapping using regexp - multiple indentations
                                 if (type(value) == str) and (value.endswith('.yaml')):
-                                    env_code.resource_registry[key] = [value, res]
+                                    env_node.resource_registry[key] = [
+                                        os.path.abspath(os.path.join(env_dir, value)), res]
 
             # Save additional parameters + parameters with default values
             if ('parameters' in env_node.structure) and (env_node.structure['parameters'] is not None):
@@ -159,26 +202,136 @@ class HotValidator:
             self.curr_nodes.remove(env_node)
 
 
+    def prefetch_templates(self):
+        ''' Parse all templates in the tree using a pool of worker processes.
+            The tree is discovered level by level and sibling templates are
+            parsed in parallel, including mapped templates of resource types
+            (mapped files not used in the tree are not parsed). Parsed documents
+            are stored in the parse cache, load_file then builds the tree
+            (links, ordering) as usual.
+        '''
+
+        level = [self.templates[0].path]
+
+        # Imported here, only needed when parsing in parallel
+        import multiprocessing
+
+        seen = set()
+        pool = multiprocessing.Pool(self.jobs)
+
+        try:
+            while level:
+                # Each file is parsed only once
+                paths = []
+                for path in level:
+                    if path not in seen:
+                        seen.add(path)
+                        paths.append(path)
+
+                level = []
+                for path, entry in pool.map(hotfile.parse_template, paths):
+                    # Errors are reported when the file is loaded
+                    if entry is None:
+                        continue
+
+                    self.cache.add(path, entry)
+
+                    # Collect children templates for the next level
+                    structure = entry[2]
+                    if ((type(structure) != dict) or ('resources' not in structure) or
+                        (type(structure['resources']) != dict)):
+                        continue
+
+                    for key, value in sorted(six.iteritems(structure['resources'])):
+                        child = hotclasses.Resource(key, value, None).type
+                        if not isinstance(child, six.string_types):
+                            continue
+
+                        if child.endswith('.yaml'):
+                            level.append(os.path.abspath(os.path.join(
+                                         os.path.dirname(path), child)))
+                        else:
+                            mapped = self.mapped_template(child, key)
+                            if mapped is not None:
+                                level.append(mapped)
+        finally:
+            pool.close()
+            pool.join()
+
+    def find_mapping(self, path):
+        ''' Return mapped file with path that is not bound to resource yet
+            (its parent is environment), None if there is no such file.
+        '''
+
+        for m in self.mappings:
+            if (m.path == path) and (m.parent in self.environments):
+                return m
+
+        return None
+
+    def mapped_template(self, resource_type, name):
+        ''' Return absolute path of template resource type is mapped to
+            (following wildcard and chained mappings as apply_mapping does),
+            None if the type is not mapped to a template.
+            resource_type - type of resource
+            name - name of resource
+        '''
+
+        seen = set()
+        while resource_type not in seen:
+            seen.add(resource_type)
+
+            ret = self.search_mapping(resource_type, name)
+            if ret is None:
+                return None
+
+            origin, mapped = ret
+            if origin.startswith('*'):
+                resource_type = resource_type.replace(origin[1:], mapped[1:])
+            elif origin.endswith('*'):
+                resource_type = resource_type.replace(origin[:-1], mapped[:-1])
+            else:
+                path = (mapped if type(mapped) == str else mapped[0])
+                if not path.endswith('.yaml'):
+                    resource_type = mapped
+                    continue
+
+                m = self.find_mapping(path)
+                return (m.path if m is not None else None)
+
+        return None
+
+    def build_param_flow(self):
+        ''' Index parameters of all files in the tree and edges between
+            properties of resources and parameters of their child files.
+        '''
+
+        self.param_flow = hotclasses.ParamIndex()
+        self.param_flow.add_file(self.templates[0])
+
+        hotclasses.walk_tree(self.child_resources(self.templates[0]), self.child_resources,
+                             self.param_flow.add_edge)
+
     def add_param_defaults(self):
-        ''' Add default from param_defaults where missing. '''
-        for env in self.environments:
-            for key, value in six.iteritems(env.params_default):
-                found = False
-                # Find corresponding parameter(s)
-                for hot in self.templates + self.mappings:
-                    for p in hot.params:
-                        # Parameter found
-                        if key == p.name:
-                            found = True
+        ''' Add default from param_defaults where missing,
+            matched defaults are marked in environments.
+        '''
 
-                            # Set value if needed
-                            if p.default is None:
-                                p.default = value
-                                break
+        for env in self.environments:
+            for key, value in list(six.iteritems(env.params_default)):
+                declared = self.param_flow.declared(key)
 
-                if not found:
+                if not declared:
                     env.invalid.append(hotclasses.InvalidReference(key,
                              '', enum.ErrorTypes.ENV_PARAM_DEFAULT, None))
+                    continue
+
+                # Set value if needed
+                for hot, p in declared:
+                    if p.default is None:
+                        p.default = value
+
+                env.params_default[key] = True
 
     def add_parameters(self):
         ''' Add additional parameters from prompt to root template file.
@@ -190,66 +343,80 @@ class HotValidator:
             for key, value in six.iteritems(self.parameters):
 
                 # If parameter exists, only insert value
-                found = False
-                for p in self.templates[0].params:
-                    if p.name == key:
-                        p.value = value
-                        found = True
-                        break
+                p = self.templates[0].param_index.get(key)
+                if p is not None:
+                    p.value = value
 
                 # If not, create one (TODO or error?)
-                if not found:
-                    self.templates[0].params.append(hotclasses.PropertyParameter((key, value), True))
+                else:
+                    p = hotclasses.PropertyParameter((key, value), True)
+                    self.templates[0].add_param(p)
+                    self.param_flow.add_param(self.templates[0], p)
 
         # Assign values to parameters from environments
         for env in self.environments:
             if env.params is not None:
 
-                # Go through all parameters declare in environments
-                for key, value in six.iteritems(env.params):
-                    found = False
-                    for p in self.templates[0].params:
-                        if p.name == key:
-                            p.value = value
-                            found = True
-                            break
+                # Go through all parameters declare in environments,
+                # matched parameters are marked in environments
+                for key, value in list(six.iteritems(env.params)):
+                    p = self.templates[0].param_index.get(key)
+                    if p is not None:
+                        p.value = value
+                        env.params[key] = True
 
                     # If parameter does not exist in the root template
-                    if not found:
+                    else:
                         env.invalid.append(hotclasses.InvalidReference(key,
                              '', enum.ErrorTypes.ENV_PARAM, None))
 
-    def search_mapping(self, mapping):
+    def build_registry(self):
+        ''' Compile resource registries of all environments into one index.
+            Index of the same environment files (path and content) is
+            compiled only once when registries are shared (batch mode).
+        '''
+
+        key = None
+        if self.registries is not None:
+            key = tuple((env.path, self.cache.digest(env.path)) for env in self.environments)
+            if key in self.registries:
+                self.registry = self.registries[key]
+                return
+
+        self.registry = hotclasses.RegistryIndex()
+        for env in self.environments:
+            for origin, mapped in six.iteritems(env.resource_registry):
+                self.registry.add(origin, mapped)
+
+        if key is not None:
+            self.registries[key] = self.registry
+
+    def search_mapping(self, mapping, name=None):
         ''' Search if there is a mapping with passed side available.
             mapping - left side of mapping
+            name - name of resource the mapping is applied to
             return tuple (original type in env file, mapped type)
         '''
 
-        for env in self.environments:
-            for origin, mapped in six.iteritems(env.resource_registry):
-                # Cover both direct and wildcard mapping
-                # Both new resource type and origin may use wildcards
-                if ((origin == mapping) or
-                   (origin.startswith('*') and mapping.endswith(origin[1:])) or
-                   (mapping.startswith('*') and origin.endswith(origin[1:])) or
-                   (origin.endswith('*') and mapping.startswith(origin[:-1])) or
-                   (mapping.endswith('*') and origin.startswith(origin[:-1]))):
-                    return (origin, mapped)
-        return None
+        # Cover both direct and wildcard mapping
+        return self.registry.match(mapping, name)
 
     def add_mappings(self, root):
         ''' Go through mappings, apply to templates using DFS.
             root - root node in current subtree
         '''
 
-        for r in root.resources:
-            for env in self.environments:
-                for origin, mapped in six.iteritems(env.resource_registry):
-                    self.apply_mapping(r, origin, mapped)
+        # Nodes are resources, mapping may add a child node to the resource
+        def enter(r):
+            ret = self.search_mapping(r.type, r.name)
+            if ret is not None:
+                self.apply_mapping(r, ret[0], ret[1])
+
+        # If child node is found, resolve mapping for it
+        def children(r):
+            return (r.child.resources if r.child is not None else [])
 
-            # If child node is found, resolve mapping for it
-            if r.child is not None:
-                self.add_mappings(r.child)
+        hotclasses.walk_tree(root.resources, children, enter)
 
     def apply_mapping(self, resource, origin, mapped):
         ''' Try to apply mapping.
@@ -259,6 +426,7 @@ class HotValidator:
 
         # Wildcard mapping
         if '*' in origin:
+            original_type = resource.type
 
             # Change its type
             if (origin.startswith('*') and resource.type.endswith(origin[1:])):
@@ -268,11 +436,12 @@ class HotValidator:
                 resource.type = resource.type.replace(origin[:-1], mapped[:-1])
 
             # Find out if newly mapped resources have other applicable mappings
-            ret = self.search_mapping(resource.type)
+            if resource.type != original_type:
+                ret = self.search_mapping(resource.type, resource.name)
 
-            # If yes, apply mapping
-            if ret is not None:
-                self.apply_mapping(resource, ret[0], ret[1])
+                # If yes, apply mapping
+                if ret is not None:
+                    self.apply_mapping(resource, ret[0], ret[1])
 
         # Direct mapping
         elif ((resource.type == origin) and
@@ -298,6 +467,9 @@ class HotValidator:
                             self.mappings.append(m.clone_file(resource.hotfile))
                             resource.child = self.mappings[-1]
                         else:
+                            # Mapped files are loaded when they are used for the first time
+                            m.load_file(self.curr_nodes, self.mappings, self.environments,
+                                        self.cache)
                             m.parent = resource.hotfile
                             resource.child = m
 
@@ -307,66 +479,182 @@ class HotValidator:
 
             if found:
                 # Find other applicable mapping
-                ret = self.search_mapping(mapped)
+                ret = self.search_mapping(mapped, resource.name)
 
                 # If found, apply mapping
                 if ret is not None:
                     self.apply_mapping(resource, ret[0], ret[1])
 
-    def validate_env_params(self):
-        ''' Check parameters section of environment files. '''
+    def validate_properties(self):
+        ''' Validate properties x parameters along edges of parameter flow
+            (in order of DFS).
+        '''
 
-        # Check parameters section
-        for env in self.environments:
-            for par in list(env.params.keys()):
-                if par in [p.name for p in self.templates[0].params]:
-                    env.params[par] = True
-                    break
+        for parent, resource, child in self.param_flow.edges:
+            child.check_prop_par(parent, resource, self.environments)
 
-        # Check parameter_defaults section
-        for env in self.environments:
-            for par in list(env.params_default.keys()):
-                for hot in self.templates + self.mappings:
-                    if par in [x.name for x in hot.params]:
-                        env.params_default[par] = True
-                        break
+    def child_resources(self, node):
+        ''' Resources of node (file or resource with child) that have child nodes. '''
 
+        if isinstance(node, hotclasses.Resource):
+            node = node.child
 
-    def validate_properties(self, template):
-        ''' Validate properties x parameters in tree of templates. '''
+        return [r for r in node.resources if r.child is not None]
 
-        # Add current node at the beginning
-        self.curr_nodes.append(self)
+    def validate_references(self, root):
+        ''' Validate references in files of tree. '''
+
+        # Validate parent, unless its result is reused from result cache
+        def enter(hot):
+            record = None
+            if self.result_cache is not None:
+                record = self.result_cache.get_result(hot.cache_key)
+                if (record is not None) and not self.dependencies_valid(record):
+                    record = None
+
+            if record is not None:
+                self.result_cache.use_result(hot.cache_key)
+                self.replay(hot, record)
+                return
+
+            self.memo.start()
+            hot.validate_file(self.curr_nodes)
+            effects, visited = self.memo.stop()
+
+            if self.result_cache is not None:
+                self.result_cache.add_result(hot.cache_key, {
+                    'effects': [(kind, effect_hot.tree_id,
+                                 ((ref.referent, ref.element, ref.type, ref.parent, ref.position)
+                                  if kind == 'invalid' else ref))
+                                for kind, effect_hot, ref in effects],
+                    'dependencies': dict((v.tree_id, v.digest) for v in visited
+                                         if not self.related(hot, v))})
+
+        def children(hot):
+            return [r.child for r in hot.resources if r.child is not None]
+
+        # Files in post-order, validation of any later file can still add
+        # invalid references to them (get_attr and get_param across the tree)
+        finished = []
+        hotclasses.walk_tree([root], children, enter, finished.append)
+
+        # Whole tree is validated, results of all files are final
+        for hot in finished:
+            self.finish_file(hot)
+
+    def related(self, hot, other):
+        ''' Check other file is hot itself, its ancestor or descendant,
+            content of these files is part of cache key of hot.
+        '''
 
-        # Go through all resources in current template
-        for resource in template.resources:
+        return ((other.tree_id == hot.tree_id) or
+                (other.tree_id == '') or (hot.tree_id == '') or
+                other.tree_id.startswith(hot.tree_id + '/') or
+                hot.tree_id.startswith(other.tree_id + '/'))
 
-            # Continue with child nodes
-            if resource.child is not None:
-                resource.child.check_prop_par(template, resource,
-                                              self.environments)
-                self.validate_properties(resource.child)
+    def dependencies_valid(self, record):
+        ''' Check files visited by validation of recorded file did not change. '''
 
-        # Remove node from current nodes after validation
-        self.curr_nodes.remove(self)
+        for tree_id, digest in six.iteritems(record['dependencies']):
+            hot = self.tree_files.get(tree_id)
+            if (hot is None) or (hot.digest != digest):
+                return False
 
+        return True
 
-    def validate_references(self, root):
-        ''' Validate references in file. '''
+    def replay(self, hot, record):
+        ''' Apply effects of validation of file hot stored in result cache
+            (invalid references and usage of its own and other files).
+        '''
+
+        for kind, tree_id, data in record['effects']:
+            effect_hot = self.tree_files[tree_id]
+            if kind == 'invalid':
+                effect_hot.add_invalid(hotclasses.InvalidReference(*data))
+            else:
+                effect_hot.mark_used(kind, data)
+
+        hot.sort_out_invalid()
+
+    def digest(self, parts):
+        ''' Return digest of list of strings. '''
+
+        return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def context_digest(self):
+        ''' Digest of inputs shared by all files - environments and parameters. '''
+
+        parts = []
+        for env in self.environments:
+            parts.append(self.cache.digest(env.path))
+
+        for key, value in sorted(six.iteritems(self.parameters)):
+            parts.append(key + '=' + value)
+
+        return self.digest(parts)
+
+    def compute_keys(self, root, upstream):
+        ''' Compute result cache keys and tree identities of nodes in tree.
+            Key of a node covers content of the node, its ancestors and
+            its whole subtree, environments and parameters. Results are
+            reused only if files visited by the validation (e.g. siblings
+            through get_attr of parent) did not change either.
+            Tree identity of a node consists of names of resources on the way
+            from the root.
+            root - root node of the tree
+            upstream - digest of context
+            Return digest of the tree.
+        '''
+
+        upstreams = {root: upstream}    # digests of ancestors and context
+        subtrees = {}                   # digests of subtrees
+        root.tree_id = ''
+
+        def enter(hot):
+            self.tree_files[hot.tree_id] = hot
+
+            # Children have current node as their ancestor
+            downstream = self.digest([upstreams[hot], hot.path, str(hot.digest)])
+            for resource in hot.resources:
+                if resource.child is not None:
+                    resource.child.tree_id = hot.tree_id + '/' + resource.name
+                    upstreams[resource.child] = self.digest([downstream, resource.name])
 
-        # Validate parent
-        root.validate_file(self.curr_nodes)
+        def leave(hot):
+            subtree = [hot.path, str(hot.digest)]
+            for resource in hot.resources:
+                if resource.child is not None:
+                    subtree.append(resource.name)
+                    subtree.append(subtrees[resource.child])
 
-        # Go through all resources in current template
-        for resource in root.resources:
+            subtrees[hot] = self.digest(subtree)
+            hot.cache_key = self.digest([upstreams[hot], subtrees[hot]])
 
-            # Continue with child nodes
-            if resource.child is not None:
-                self.validate_references(resource.child)
+        def children(hot):
+            return [r.child for r in hot.resources if r.child is not None]
+
+        hotclasses.walk_tree([root], children, enter, leave)
+
+        return subtrees[root]
+
+    def finish_file(self, root):
+        ''' Whole tree is validated, stream the result of file (--format). '''
+
+        if self.output is not None:
+            self.output.hot_file(root)
 
     def print_tree(self, root, root_position, indent, branch_list):
         ''' Print tree structure of templates. '''
 
+        # Nodes are tuples (file, position, indent, branch list)
+        hotclasses.walk_tree([(root, root_position, indent, branch_list)],
+                             self.tree_children, self.print_tree_node)
+
+    def print_tree_node(self, node):
+        ''' Print one node of tree structure. '''
+
+        root, root_position, indent, branch_list = node
+
         # Print higher branches
         if (len(branch_list) and (root_position != enum.TreeInfo.ONLY)):
             cur_indent = 0
@@ -381,27 +669,25 @@ class HotValidator:
         # Print child node
         if indent > 0:
             if root_position == enum.TreeInfo.ONLY:
-                print (' ── ' + root.path, end="")
+                print (' ── ' + os.path.relpath(root.path, self.init_dir), end="")
             elif root_position == enum.TreeInfo.OTHER:
-                print ('├─ ' + root.path, end="")
+                print ('├─ ' + os.path.relpath(root.path, self.init_dir), end="")
             elif root_position == enum.TreeInfo.LAST:
-                print ('└─ ' + root.path, end="")
+                print ('└─ ' + os.path.relpath(root.path, self.init_dir), end="")
         else:
-            print(root.path, end="")
+            print(os.path.relpath(root.path, self.init_dir), end="")
+
+    def tree_children(self, node):
+        ''' Children of node in tree structure with their positions. '''
 
+        root, root_position, indent, branch_list = node
         indent = indent + 1
 
         # Find out first and last child/sibling
-        lastindex = None
-        firstindex = None
-        for r in root.resources:
-            if r.child is not None:
-                lastindex = root.resources.index(r)
-                if firstindex is None:
-                    firstindex = root.resources.index(r)
+        children = [r.child for r in root.resources if r.child is not None]
 
         # Determine child position
-        if ((lastindex is not None) and (lastindex == firstindex)):
+        if len(children) == 1:
             child_position = enum.TreeInfo.ONLY
         else:
             child_position = enum.TreeInfo.OTHER
@@ -410,125 +696,155 @@ class HotValidator:
         if root_position != enum.TreeInfo.ONLY:
             branch_list = branch_list + [indent-1]
 
-        # Print subtrees of children
-        for r in root.resources:
-            if r.child is not None:
-                if ((child_position != enum.TreeInfo.ONLY) and
-                    (root.resources.index(r) == lastindex)):
-                    child_position = enum.TreeInfo.LAST
+        # Subtrees of children
+        for index, child in enumerate(children):
+            if ((child_position != enum.TreeInfo.ONLY) and
+                (index == len(children) - 1)):
+                child_position = enum.TreeInfo.LAST
 
-                self.print_tree(r.child, child_position, indent, branch_list)
+            yield (child, child_position, indent, branch_list)
 
 
     def run(self):
         ''' Run validator. '''
 
-        # Initialize nyanbar
+        # Initialize nyanbar, each phase is one task
         if self.print_nyan:
-            progress = nyanbar.NyanBar(tasks=6)
+            self.progress = nyanbar.NyanBar(tasks=(7 if self.jobs > 1 else 6))
+
+        self.phase_start = timeit.default_timer()
 
         # Load environments to get mappings
         self.load_environments()
+        self.build_registry()
+        self.phase_done('environments')
 
-        if self.print_nyan:
-            progress.task_done()
-            time.sleep(self.sleep_time)
-
-        # Load HOTs in mappings
-        # All mappings are at the beginning, followed by children nodes
-        for hot in self.mappings:
-            if hot.parent in self.environments:
-                hot.load_file(self.curr_nodes, self.mappings,
-                                  self.environments, os.path.join(self.init_dir,
-                                  os.path.dirname(hot.parent.path)))
-            else:
-                break
-
-        if self.print_nyan:
-            progress.task_done()
-            time.sleep(self.sleep_time)
+        # Parse the whole tree in parallel, loading below then uses parsed files
+        if self.jobs > 1:
+            self.prefetch_templates()
+            self.phase_done('parallel parsing')
 
         # Load HOTs: change to its directory, validate -f
         self.templates[0].load_file(self.curr_nodes, self.templates,
-                                             self.environments,
-                                             os.path.join(self.init_dir,
-                                             os.path.dirname(self.templates[0].path)))
+                                    self.environments, self.cache)
+        self.phase_done('root template')
 
-        # Add param_defaults from environments where default is missing
+        # Also add mapped files as children once there is a full structure of files
+        # (if done earlier, some mapped types used in mapped files could be skipped),
+        # mapped files are loaded here, files not used in the tree are never loaded
+        self.add_mappings(self.templates[0])
+        self.phase_done('mappings')
+
+        # Add param_defaults from environments where default is missing,
+        # environment parameters are checked against fully loaded HOT structure
+        self.build_param_flow()
         self.add_param_defaults()
         self.add_parameters()
+        self.phase_done('parameters')
 
-        if self.print_nyan:
-            progress.task_done()
-            time.sleep(self.sleep_time)
+        # Check properties x parameters
+        self.validate_properties()
+        self.phase_done('properties')
+
+        # Reuse results of files whose content and context did not change
+        if self.result_cache is not None:
+            self.compute_keys(self.templates[0], self.context_digest())
+
+        # Identical references are resolved only once in each file
+        self.memo = hotclasses.ReferenceMemo()
+        for hot in self.templates + self.mappings:
+            hot.memo = self.memo
+
+        # Results of environments are known by now, files are streamed
+        # as soon as the whole tree is validated
+        if self.output is not None:
+            self.output.start()
+            for env in self.environments:
+                self.output.environment(env)
 
-        # Also add mapped files as children once there is a full structure of files
-        # (if done earlier, some mapped types used in mapped files could be skipped)
-        self.add_mappings(self.templates[0])
+        # Validate references
+        self.validate_references(self.templates[0])
 
-        # Check environment parameters against fully loaded HOT structure
-        self.validate_env_params()
+        if (self.result_cache is not None) and self.save_results:
+            self.result_cache.save()
+
+        self.phase_done('references')
 
         if self.print_nyan:
-            progress.task_done()
-            time.sleep(self.sleep_time)
+            self.progress.finish()
 
-        # Check properties x parameters
-        self.validate_properties(self.templates[0])
+    def cache_hits(self):
+        ''' Total number of hits of all caches (parsed files, references, results). '''
 
-        for hot in self.mappings:
-            if hot.parent in self.environments:
-                self.validate_properties(hot)
+        hits = self.cache.hits
+        if self.memo is not None:
+            hits = hits + self.memo.hits
+        if self.result_cache is not None:
+            hits = hits + self.result_cache.hits
 
-        if self.print_nyan:
-            progress.task_done()
-            time.sleep(self.sleep_time)
+        return hits
 
-        # Validate references
-        self.validate_references(self.templates[0])
+    def phase_done(self, name):
+        ''' Finish phase of run - record its timing (--timings), move nyanbar.
+            Files, resources and references are totals in the tree after the phase,
+            cache hits are counted for the phase only.
+        '''
+
+        if self.print_timings:
+            elapsed = timeit.default_timer() - self.phase_start
 
-        # Basic duplicate invalid references removal
-        #self.remove_duplicates(self.templates[0])
+            hot_files = self.templates + self.mappings
+            hits = self.cache_hits()
+            self.timings.append((name, elapsed,
+                len(self.environments) + len(hot_files),
+                sum(len(hot.resources) for hot in hot_files),
+                sum(len(hot.references.references) + len(hot.references.dependencies)
+                    for hot in hot_files if hot.references is not None),
+                hits - sum(t[5] for t in self.timings)))
 
         if self.print_nyan:
-            progress.task_done()
-            time.sleep(self.sleep_time)
-            progress.finish()
+            self.progress.task_done()
 
+        # Counting is not part of the next phase
+        self.phase_start = timeit.default_timer()
 
-    #def remove_duplicates(self, root):
-        #''' Go through invalid references, remove duplicates. '''
+    def print_timing_table(self, stream=sys.stderr):
+        ''' Print timings of phases (--timings). '''
 
-        ## TODO: optimize
-        #if len(root.invalid) > 0:
+        row = '{0:<18} {1:>10} {2:>7} {3:>10} {4:>11} {5:>11}'
 
-            #tmp = root.invalid[0] # invalid references to be compared
-            #list_len = len(root.invalid) # list length
-            #i = 1 # iterating value
+        print('Timings:', file=stream)
+        print(row.format('Phase', 'Time [s]', 'Files', 'Resources', 'References', 'Cache hits'),
+              file=stream)
+        for name, elapsed, files, resources, references, hits in self.timings:
+            print(row.format(name, '{0:.4f}'.format(elapsed), files, resources, references, hits),
+                  file=stream)
+        print(row.format('total', '{0:.4f}'.format(sum(t[1] for t in self.timings)), '', '', '', ''),
+              file=stream)
 
-            #while i < list_len:
-                ## Find duplicate
-                #if ((tmp.referent == root.invalid[i].referent) and
-                    #(tmp.element == root.invalid[i].element) and
-                    #(tmp.type == root.invalid[i].type) and
-                    #(tmp.parent == root.invalid[i].parent)):
+    def position(self, node, ref):
+        ''' Return ' (file:line:column)' of invalid reference in node, if known. '''
 
-                    ## Remove it
-                    #root.invalid.remove(root.invalid[i])
-                    #list_len = list_len - 1
-                #else:
-                    ## Only increment if current element has not been removed
-                    #i = i + 1
-                
+        if ref.position is None:
+            return ''
 
-        ## Continue with children
-        #for r in root.resources:
-            #if r.child is not None:
-                #self.remove_duplicates(r.child)
+        return (' (' + os.path.relpath(node.path, self.init_dir) + ':' +
+                str(ref.position[0]) + ':' + str(ref.position[1]) + ')')
 
     def print_output(self):
         ''' Print results of validation for all files + additional info. '''
 
+        # Mapped files not used in the tree are neither loaded nor validated
+        mappings = [x for x in self.mappings if x.parent not in self.environments]
+        unused = [x for x in self.mappings if x.parent in self.environments]
+
+        # Validated files are streamed already, only unused mapped files remain
+        if self.output is not None:
+            for hot in unused:
+                self.output.unused_mapping(hot)
+            self.output.finish()
+            return
+
         # Environments
         if self.environments:
             if self.pretty_format:
@@ -599,7 +915,7 @@ class HotValidator:
         # HOT Files and mappings
         # TODO: Print as DFS, rather going through the tree instead of the list
         # TODO: Print new line between HOT and mapped HOT
-        for hot in [x for x in [self.templates, self.mappings] if len(x)]:
+        for hot in [x for x in [self.templates, mappings] if len(x)]:
 
             if self.pretty_format:
                 print(enum.Fonts.ORANGE + enum.Fonts.BOLD + enum.Fonts.UNDERLINE +
@@ -610,10 +926,10 @@ class HotValidator:
 
             # Print total
             if self.pretty_format:
-                print(enum.Fonts.BOLD + 'Total: ' + str(len(self.templates) if hot == self.templates else len(self.mappings)) +
+                print(enum.Fonts.BOLD + 'Total: ' + str(len(hot)) +
                       enum.Fonts.DEFAULT)
             else:
-                print ('Total: ' + str(len(self.templates) if hot == self.templates else len(self.mappings)))
+                print ('Total: ' + str(len(hot)))
             print('')
 
             for node in hot:
@@ -652,20 +968,24 @@ class HotValidator:
                             if self.pretty_format:
                                 print ('Resource ' + enum.Fonts.YELLOW + ref.referent +
                                        enum.Fonts.DEFAULT + ' referred in ' + enum.Fonts.YELLOW +
-                                       ref.element + enum.Fonts.DEFAULT + ' is not declared.')
+                                       ref.element + enum.Fonts.DEFAULT + ' is not declared.' +
+                                       self.position(node, ref))
                             else:
                                 print ('Resource ' + ref.referent + ' referred in ' + ref.element +
-                                       ' is not declared.')
+                                       ' is not declared.' +
+                                       self.position(node, ref))
 
                         # get_param
                         elif ref.type == enum.ErrorTypes.GET_PARAM:
                             if self.pretty_format:
                                 print ('Parameter ' + enum.Fonts.YELLOW + ref.referent +
                                        enum.Fonts.DEFAULT + ' referred in ' + enum.Fonts.YELLOW +
-                                       ref.element + enum.Fonts.DEFAULT + ' is not declared.')
+                                       ref.element + enum.Fonts.DEFAULT + ' is not declared.' +
+                                       self.position(node, ref))
                             else:
                                 print ('Parameter ' + ref.referent + ' referred in ' + ref.element +
-                                       ' is not declared.')
+                                       ' is not declared.' +
+                                       self.position(node, ref))
 
                         # get_attr
                         elif ref.type == enum.ErrorTypes.GET_ATTR:
@@ -673,10 +993,12 @@ class HotValidator:
                                 print ('Instance ' + enum.Fonts.YELLOW + ref.referent +
                                        enum.Fonts.DEFAULT + ' referred by ' + enum.Fonts.YELLOW +
                                        'get_attr' + enum.Fonts.DEFAULT + ' in ' + enum.Fonts.YELLOW +
-                                       ref.element + enum.Fonts.DEFAULT + ' is not declared.')
+                                       ref.element + enum.Fonts.DEFAULT + ' is not declared.' +
+                                       self.position(node, ref))
                             else:
                                 print ('Instance ' + ref.referent + ' referred by get_attr in ' +
-                                       ref.element + ' is not declared.')
+                                       ref.element + ' is not declared.' +
+                                       self.position(node, ref))
 
                         # missing property
                         elif ref.type == enum.ErrorTypes.MISS_PROP:
@@ -704,10 +1026,12 @@ class HotValidator:
                             if self.pretty_format:
                                 print('Resource ' + enum.Fonts.YELLOW + ref.referent + enum.Fonts.DEFAULT +
                                       ' that resource ' +  enum.Fonts.YELLOW +
-                                      ref.element + enum.Fonts.DEFAULT + ' depends on is not declared.')
+                                      ref.element + enum.Fonts.DEFAULT + ' depends on is not declared.' +
+                                      self.position(node, ref))
                             else:
                                 print('Resource ' + ref.referent + ' that resource ' +
-                                      ref.element + ' depends on is not declared.')
+                                      ref.element + ' depends on is not declared.' +
+                                      self.position(node, ref))
                     print('')
 
                 # Unused parameters
@@ -772,6 +1096,25 @@ class HotValidator:
                     else:
                         print('Status: FAILED')
 
+        # Print mapped files that no resource is mapped to (not loaded)
+        if unused:
+            print('')
+            if self.pretty_format:
+                print(enum.Fonts.ORANGE + enum.Fonts.BOLD + enum.Fonts.UNDERLINE +
+                      'Unused mappings:' + enum.Fonts.DEFAULT)
+            else:
+                print('Unused mappings:')
+
+            for node in unused:
+                if self.pretty_format:
+                    print('- ' + enum.Fonts.YELLOW + os.path.relpath(node.path, self.init_dir) +
+                          enum.Fonts.DEFAULT +
+                          ' (' + os.path.relpath(node.parent.path, self.init_dir) + ')')
+                else:
+                    print('- ' + os.path.relpath(node.path, self.init_dir) + ' (' +
+                          os.path.relpath(node.parent.path, self.init_dir) + ')')
+            print('')
+
         # Print tree structure
         if self.print_structure:
             if self.pretty_format:
@@ -782,3 +1125,11 @@ class HotValidator:
 
             self.print_tree(self.templates[-1], enum.TreeInfo.ONLY, 0, [])
             print('\n')
+
+        # Print used YAML parser
+        if self.print_backend:
+            if self.pretty_format:
+                print(enum.Fonts.BOLD + 'YAML backend: ' + enum.Fonts.DEFAULT +
+                      yamlloader.BACKEND)
+            else:
+                print('YAML backend: ' + yamlloader.BACKEND)
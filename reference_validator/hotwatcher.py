@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+# File: hotwatcher.py
+# Brief: Contains class HotWatcher for re-validating templates on file change
+
+from __future__ import with_statement, print_function
+
+import os
+import sys
+import time
+
+import hotclasses
+import hotvalidator
+
+# import pyinotify if available, otherwise files are polled
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+class HotWatcher:
+    ''' Run validator again whenever one of the loaded files changes. '''
+
+    def __init__(self, arguments):
+        ''' arguments - dictionary with parsed arguments and their values '''
+
+        self.arguments = arguments
+        self.poll_interval = 0.5    # seconds between checks without inotify
+        self.settle_time = 0.1      # wait for editors to finish writing
+
+        # Kept in memory between runs - only changed files are parsed
+        # and only their subtrees and ancestors are validated again
+        self.result_cache = hotclasses.ResultCache(arguments['cache_file'])
+        self.cache = hotclasses.ParseCache(self.result_cache)
+
+    def run(self):
+        ''' Validate, wait for change, repeat until interrupted. '''
+
+        while True:
+            validator = hotvalidator.HotValidator(self.arguments, self.cache,
+                                                  self.result_cache)
+
+            # Invalid YAML ends validation, wait for it to be fixed
+            try:
+                validator.run()
+                validator.print_output()
+                if self.arguments['timings']:
+                    validator.print_timing_table()
+            except SystemExit:
+                pass
+
+            # Watch all files requested by now, including the ones that failed
+            paths = set(self.cache.paths)
+            for env in validator.environments:
+                paths.add(env.path)
+            paths.add(validator.templates[0].path)
+
+            print('Watching ' + str(len(paths)) + ' files for changes...', file=sys.stderr)
+            sys.stdout.flush()
+
+            if pyinotify is not None:
+                self.wait_inotify(paths)
+            else:
+                self.wait_poll(paths)
+
+            time.sleep(self.settle_time)
+            print('', file=sys.stderr)
+
+    def snapshot(self, paths):
+        ''' Return {path: (mtime, size)}, None for missing files. '''
+
+        state = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                state[path] = (stat.st_mtime, stat.st_size)
+            except OSError:
+                state[path] = None
+
+        return state
+
+    def wait_poll(self, paths):
+        ''' Poll files until one of them changes. '''
+
+        state = self.snapshot(paths)
+        while self.snapshot(paths) == state:
+            time.sleep(self.poll_interval)
+
+    def wait_inotify(self, paths):
+        ''' Wait for inotify event on one of the files.
+            Directories are watched so that files replaced by editors
+            (written elsewhere and renamed) are detected as well.
+        '''
+
+        changed = []
+
+        class Handler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                if event.pathname in paths:
+                    changed.append(event.pathname)
+
+        manager = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(manager, Handler())
+        mask = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO |
+                pyinotify.IN_CREATE | pyinotify.IN_DELETE)
+
+        for directory in set(os.path.dirname(p) for p in paths):
+            if os.path.isdir(directory):
+                manager.add_watch(directory, mask)
+
+        try:
+            while not changed:
+                if notifier.check_events():
+                    notifier.read_events()
+                    notifier.process_events()
+        finally:
+            notifier.stop()
@@ -11,7 +11,9 @@ from __future__ import with_statement, print_function
 import argparse
 import sys
 
+import hotbatch
 import hotvalidator
+import hotwatcher
 
 def main():
 
@@ -23,17 +25,90 @@ def main():
                         help='When true, provides colorful output')
     parser.add_argument('-t', '--print-tree', action='store_true',
                         help='When true, output contains template structure')
+    parser.add_argument('-b', '--print-backend', action='store_true',
+                        help='When true, prints which YAML parser backend was used.')
     parser.add_argument('-e', '--environment-file', metavar='path/to/environment', action='append',
                         help='Environment files to be used.')
-    parser.add_argument('-f', '--template-file', metavar='path/to/file',
-                        help='HOT file to be used.')
+    parser.add_argument('-f', '--template-file', metavar='path/to/file', action='append',
+                        help='HOT file to be used (more files are validated in batch mode).')
+    parser.add_argument('-m', '--manifest', metavar='path/to/manifest',
+                        help='YAML list of root templates with their environments (batch mode).')
     parser.add_argument('-P', '--parameters', metavar='<KEY1=VALUE1;KEY2=VALUE2...>', action='append',
                         help='Parameter values used in the templates.')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                        help='Number of processes used for parsing templates (roots in batch mode).')
+    parser.add_argument('-c', '--cache-file', metavar='path/to/cache',
+                        help='Cache of results, only changed files are validated again.')
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help='When true, validates again whenever a file changes.')
+    parser.add_argument('-F', '--format', dest='output_format', default='text',
+                        choices=['text', 'json', 'jsonl', 'sarif'],
+                        help='Output format, machine-readable formats are streamed per file.')
+    parser.add_argument('-T', '--timings', action='store_true',
+                        help='When true, prints time and counts of each phase of validation.')
+    parser.add_argument('--profile', metavar='path/to/stats',
+                        help='Profile validation, write statistics for pstats to file.')
     parser.add_argument('-n', '--nyan', action='store_true',
                         help='When true, prints nyanbar.')
 
+    arguments = vars(parser.parse_args())
+
+    # Profile the whole validation (--profile)
+    profiler = None
+    if arguments['profile']:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        validate(parser, arguments)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(arguments['profile'])
+
+    sys.exit(0)
+
+def validate(parser, arguments):
+    ''' Validate templates entered by parsed arguments. '''
+
+    # Root templates from -f share -e and -P, manifest roots have their own
+    roots = [(t, arguments['environment_file'] or [], arguments['parameters'] or [])
+             for t in (arguments['template_file'] or [])]
+    if arguments['manifest']:
+        try:
+            roots = roots + hotbatch.read_manifest(arguments['manifest'])
+        except (IOError, OSError):
+            print('File ' + arguments['manifest'] + ' could not be opened.')
+            sys.exit(1)
+        except Exception as err:
+            print('ERROR in file ' + arguments['manifest'] + ': ' + str(err), file=sys.stderr)
+            sys.exit(1)
+
+    if not roots:
+        parser.error('no template file (-f) or manifest (-m) entered')
+
+    # Validate all roots in one process, shared parsed files
+    if (len(roots) > 1) or arguments['manifest']:
+        if arguments['watch']:
+            parser.error('watch mode (-w) validates one root template only')
+
+        batch = hotbatch.HotBatch(arguments, roots)
+        batch.run()
+        batch.print_output()
+        return
+
+    arguments['template_file'] = roots[0][0]
+
+    # Keep validating until interrupted
+    if arguments['watch']:
+        try:
+            hotwatcher.HotWatcher(arguments).run()
+        except KeyboardInterrupt:
+            sys.exit(0)
+
     # Initialize validator
-    validator = hotvalidator.HotValidator(vars(parser.parse_args()))
+    validator = hotvalidator.HotValidator(arguments)
 
     # Run validator
     validator.run()
@@ -41,7 +116,8 @@ def main():
     # Print results
     validator.print_output()
 
-    sys.exit(0)
+    if arguments['timings']:
+        validator.print_timing_table()
 
 if __name__ == '__main__':
     main()
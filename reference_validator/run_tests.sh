@@ -18,9 +18,12 @@ TESTS=()
 ELEMENTS=2
 CLEAN=false # Remove logs afterwards
 VERBOSE=false # prints diff if test failed
+RESULT=0 # exit status, 1 if any test failed
 
 LOG_DIR=tests/test_logs
 DIFF_DIR=tests/test_diffs
+CACHE_FILE=$LOG_DIR/results.cache
+CHAIN_DIR=$LOG_DIR/chain
 PYTHON=python
 PYTHON3=python3
 
@@ -46,14 +49,55 @@ TEST06=("Test 6 - Basic HOT resolution:" \
 TEST07=("Test 7 - Advanced HOT resolution:" \
         "reference_validator.py -f tests/test_files/07_root.yaml -e tests/test_files/07_env1.yaml -e tests/test_files/07_env2.yaml -u")
 
+TEST08=("Test 8 - JSON output:" \
+        "reference_validator.py -f tests/test_files/06_root.yaml -e tests/test_files/06_env.yaml -F json")
+
+TEST09=("Test 9 - JSON lines output:" \
+        "reference_validator.py -f tests/test_files/07_root.yaml -e tests/test_files/07_env1.yaml -e tests/test_files/07_env2.yaml -F jsonl")
+
+TEST10=("Test 10 - SARIF output:" \
+        "reference_validator.py -f tests/test_files/07_root.yaml -e tests/test_files/07_env1.yaml -e tests/test_files/07_env2.yaml -F sarif")
+
+# Second run reuses results of the first one, output is the same as in test 7
+TEST11=("Test 11 - Result cache (first run):" \
+        "reference_validator.py -f tests/test_files/07_root.yaml -e tests/test_files/07_env1.yaml -e tests/test_files/07_env2.yaml -u -c $CACHE_FILE")
+
+TEST12=("Test 12 - Result cache (reused results):" \
+        "reference_validator.py -f tests/test_files/07_root.yaml -e tests/test_files/07_env1.yaml -e tests/test_files/07_env2.yaml -u -c $CACHE_FILE")
+
+# get_attr chain of 1100 generated templates is deeper than the recursion limit
+TEST13=("Test 13 - Long chain of nested templates:" \
+        "reference_validator.py -f $CHAIN_DIR/root.yaml -e $CHAIN_DIR/env.yaml -F sarif")
+
+# Roots of manifest share parsed files, output does not depend on number of jobs
+TEST14=("Test 14 - Batch mode:" \
+        "reference_validator.py -m tests/test_files/14_manifest.yaml")
+
+TEST15=("Test 15 - Batch mode (more jobs):" \
+        "reference_validator.py -m tests/test_files/14_manifest.yaml -j 2")
+
+# Records of a file are final only after get_attr of its sibling is resolved
+TEST16=("Test 16 - Streamed output with get_attr of sibling:" \
+        "reference_validator.py -f tests/test_files/16_root.yaml -F jsonl")
+
 TESTS=("${TEST01[@]}" "${TEST02[@]}" "${TEST03[@]}" "${TEST04[@]}")
 TESTS+=("${TEST05[@]}" "${TEST06[@]}" "${TEST07[@]}")
+TESTS+=("${TEST08[@]}" "${TEST09[@]}" "${TEST10[@]}")
+TESTS+=("${TEST11[@]}" "${TEST12[@]}" "${TEST13[@]}")
+TESTS+=("${TEST14[@]}" "${TEST15[@]}" "${TEST16[@]}")
 
 TESTS_NR=`expr ${#TESTS[@]} / $ELEMENTS`
 
 # Function for running tests
 function run_test() {
 
+    # Test was not found in TESTS (wrong index)
+    if [[ -z "${1}" || -z "${2}" ]]; then
+        printf "Test ${3} ${RED}NOT FOUND${DEFAULT}\n"
+        RESULT=1
+        return
+    fi
+
     # Run command - both stderr and stdout go to the same log file
     ${4} ${2} >$LOG_DIR/${3}.${4}.log 2>&1
 
@@ -65,6 +109,7 @@ function run_test() {
         printf "${1} ${GREEN}OK${DEFAULT}\n"
     else
         printf "${1} ${RED}FAILED${DEFAULT}\n"
+        RESULT=1
 
         # Print diff output if verbose option is set
         if [ "$VERBOSE" = true ]
@@ -102,27 +147,40 @@ do
     shift # past argument or value
 done
 
+# Generate templates of long chain
+$PYTHON3 benchmark/generate.py $CHAIN_DIR --roles 1 --resources 1 --params 1 --depth 1100 >/dev/null
+
 # Run tests in loop
 printf "${BOLD}Running YAML reference validator tests for python${DEFAULT}\n"
 
+# Start without results of previous runs
+rm -f $CACHE_FILE
+
 # Add zero padding
 for T in $(seq -f "%02g" 1 $TESTS_NR)
 do
-   run_test "${TESTS[@]:$(( (T - 1) * ELEMENTS )):$ELEMENTS}" $T $PYTHON
+   # T is zero-padded, it must not be read as octal number
+   run_test "${TESTS[@]:$(( (10#$T - 1) * ELEMENTS )):$ELEMENTS}" $T $PYTHON
 done
 
 printf "${BOLD}Running YAML reference validator tests for python 3${DEFAULT}\n"
 
+# Start without results of previous runs
+rm -f $CACHE_FILE
+
 # Add zero padding
 for T in $(seq -f "%02g" 1 $TESTS_NR)
 do
-   run_test "${TESTS[@]:$(( (T - 1) * ELEMENTS )):$ELEMENTS}" $T $PYTHON3
+   # T is zero-padded, it must not be read as octal number
+   run_test "${TESTS[@]:$(( (10#$T - 1) * ELEMENTS )):$ELEMENTS}" $T $PYTHON3
 done
 
 # Remove log files if -c is set
 if [ "$CLEAN" = true ]
 then
    rm tests/test_logs/*.log
+   rm -f $CACHE_FILE
+   rm -rf $CHAIN_DIR
 fi
 
-exit
+exit $RESULT
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+# File: yamlloader.py
+# Brief: Shared YAML loading layer, uses libyaml C loader when available
+
+from __future__ import with_statement, print_function
+
+import six  # compatibility
+import yaml # pip install pyyaml
+
+# Use libyaml bindings if PyYAML was built with them
+try:
+    Loader = yaml.CSafeLoader
+    BACKEND = 'libyaml'
+except AttributeError:
+    Loader = yaml.SafeLoader
+    BACKEND = 'python'
+
+# Keys whose position is kept (references and dependencies)
+MARKED_KEYS = frozenset(('get_param', 'get_resource', 'get_attr', 'depends_on'))
+
+
+def marked_loader(base):
+    ''' Return loader class based on loader base that keeps start marks
+        of MARKED_KEYS in a side table.
+        Marks are tuples (mapping, key, line, column), line and column
+        start with 1. Mapping is the dictionary containing the key, so
+        the table is valid as long as the structure (also when both are
+        pickled together). Other nodes do not keep any marks.
+    '''
+
+    class MarkedLoader(base):
+
+        def __init__(self, stream):
+            base.__init__(self, stream)
+            self.marks = []
+
+        def construct_marked_map(self, node):
+            ''' Construct mapping as SafeLoader does, keep marks of its keys. '''
+
+            data = {}
+            yield data
+
+            self.flatten_mapping(node)
+            for key_node, value_node in node.value:
+                key = self.construct_object(key_node)
+                try:
+                    data[key] = self.construct_object(value_node)
+                except TypeError:
+                    raise yaml.constructor.ConstructorError('while constructing a mapping',
+                            node.start_mark, 'found unhashable key', key_node.start_mark)
+
+                if key in MARKED_KEYS:
+                    self.marks.append((data, key, key_node.start_mark.line + 1,
+                                       key_node.start_mark.column + 1))
+
+    MarkedLoader.add_constructor(u'tag:yaml.org,2002:map', MarkedLoader.construct_marked_map)
+
+    return MarkedLoader
+
+MarkedLoader = marked_loader(Loader)
+PythonMarkedLoader = (MarkedLoader if Loader is yaml.SafeLoader else marked_loader(yaml.SafeLoader))
+
+
+def load(stream):
+    ''' Parse YAML document using the fastest available safe loader.
+        stream - string with file content
+    '''
+
+    try:
+        return yaml.load(stream, Loader=Loader)
+    except yaml.YAMLError:
+        # libyaml messages lack the context snippet, parse the document
+        # again with the pure Python loader to get the detailed error
+        if (Loader is yaml.SafeLoader) or (not isinstance(stream, six.string_types)):
+            raise
+        return yaml.load(stream, Loader=yaml.SafeLoader)
+
+
+def load_marked(stream):
+    ''' Parse YAML document, return tuple (structure, marks), see marked_loader.
+        stream - string with file content
+    '''
+
+    loader = MarkedLoader(stream)
+    try:
+        return (loader.get_single_data(), loader.marks)
+    except yaml.YAMLError:
+        # Same as in load - detailed error, the pure Python loader
+        # also accepts some documents libyaml does not
+        if (Loader is yaml.SafeLoader) or (not isinstance(stream, six.string_types)):
+            raise
+    finally:
+        loader.dispose()
+
+    loader = PythonMarkedLoader(stream)
+    try:
+        return (loader.get_single_data(), loader.marks)
+    finally:
+        loader.dispose()